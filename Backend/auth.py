@@ -1,13 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from pydantic import BaseModel, EmailStr
+from collections import OrderedDict, deque
 from datetime import datetime, timedelta
-import sqlite3
+import math
 import os
+import threading
+import time
 from dotenv import load_dotenv
-from database import get_db
+from database import execute, fetch_one, pool, run_read, write_db
+from passwords import PasswordBusy, hash_password, verify_password
 
 router = APIRouter()
 
@@ -16,11 +19,22 @@ load_dotenv(os.path.join(os.path.dirname(__file__), ".env"))
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
+# How long a user row is trusted before it is read again. Role changes and
+# deleted accounts take effect within this window unless invalidate_user()
+# is called by the code that changes them.
+USER_CACHE_SECONDS = float(os.getenv("USER_CACHE_SECONDS", "30"))
+# Decoded tokens kept in memory; a verified signature is reused until the
+# token's own expiry.
+TOKEN_CACHE_SIZE = 1024
+# Failed logins allowed per account, and login/register attempts per client
+# address, within LOGIN_THROTTLE_SECONDS before further tries get a 429.
+LOGIN_THROTTLE_SECONDS = int(os.getenv("LOGIN_THROTTLE_SECONDS", "300"))
+LOGIN_FAILURES_PER_ACCOUNT = int(os.getenv("LOGIN_FAILURES_PER_ACCOUNT", "5"))
+LOGIN_ATTEMPTS_PER_IP = int(os.getenv("LOGIN_ATTEMPTS_PER_IP", "30"))
 
 if not SECRET_KEY:
     raise RuntimeError("SECRET_KEY environment variable is required")
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
 
@@ -51,12 +65,116 @@ class AdminCreateUser(BaseModel):
     role: str = "user"
 
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+class _Throttle:
+    # Sliding window of recent hits per key.
+    def __init__(self, limit: int, window: int):
+        self.limit = limit
+        self.window = window
+        self._hits: dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def _prune(self, key: str, now: float) -> deque | None:
+        hits = self._hits.get(key)
+        while hits and hits[0] <= now - self.window:
+            hits.popleft()
+        if hits is not None and not hits:
+            del self._hits[key]
+            return None
+        return hits
+
+    def retry_after(self, key: str) -> int:
+        # Seconds until the key may try again; 0 when it is not throttled.
+        now = time.monotonic()
+        with self._lock:
+            hits = self._prune(key, now)
+            if hits is None or len(hits) < self.limit:
+                return 0
+            return max(1, math.ceil(hits[0] + self.window - now))
+
+    def hit(self, key: str) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._hits.setdefault(key, deque()).append(now)
+            if len(self._hits) > 10000:
+                for stale in list(self._hits):
+                    self._prune(stale, now)
+
+    def clear(self, key: str) -> None:
+        with self._lock:
+            self._hits.pop(key, None)
+
+
+_account_failures = _Throttle(
+    LOGIN_FAILURES_PER_ACCOUNT, LOGIN_THROTTLE_SECONDS
+)
+_ip_attempts = _Throttle(LOGIN_ATTEMPTS_PER_IP, LOGIN_THROTTLE_SECONDS)
+
+
+def _check_throttle(throttle: _Throttle, key: str) -> None:
+    retry_after = throttle.retry_after(key)
+    if retry_after:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many attempts. Try again later.",
+            headers={"Retry-After": str(retry_after)},
+        )
+
 
+def _client_ip(request: Request) -> str:
+    return request.client.host if request.client else ""
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+
+def _password_busy() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Authentication is busy. Try again shortly.",
+        headers={"Retry-After": "1"},
+    )
+
+
+def _insert_user(
+    db, name: str, email: str, hashed_password: str, role: str
+) -> int:
+    c = db.cursor()
+    c.execute("SELECT id FROM users WHERE email=?", (email,))
+    if c.fetchone():
+        raise HTTPException(
+            status_code=400, detail="Email already registered."
+        )
+    c.execute(
+        (
+            "INSERT INTO users (name, email, password, role, verified) "
+            "VALUES (?, ?, ?, ?, ?)"
+        ),
+        (name, email, hashed_password, role, True),
+    )
+    return c.lastrowid
+
+
+async def _create_user(
+    name: str, email: str, password: str, role: str
+) -> UserOut:
+    # Hashes before taking the write lock, so other writes never wait on
+    # bcrypt.
+    if len(password) < 8:
+        raise HTTPException(
+            status_code=400, detail="Password must be at least 8 characters."
+        )
+    if await fetch_one("SELECT id FROM users WHERE email=?", (email,)):
+        raise HTTPException(
+            status_code=400, detail="Email already registered."
+        )
+    try:
+        hashed_password = await hash_password(password)
+    except PasswordBusy:
+        raise _password_busy()
+    user_id = await write_db(
+        _insert_user, name, email, hashed_password, role
+    )
+    invalidate_user(user_id)
+    return UserOut(
+        id=user_id, name=name, email=email, role=role, verified=True
+    )
 
 
 def create_access_token(data: dict):
@@ -66,70 +184,95 @@ def create_access_token(data: dict):
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
+_token_cache: OrderedDict[str, dict] = OrderedDict()
+_token_lock = threading.Lock()
+_user_cache: dict[int, tuple[float, dict]] = {}
+_user_lock = threading.Lock()
+
+
 def decode_access_token(token: str):
+    with _token_lock:
+        payload = _token_cache.get(token)
+        if payload is not None:
+            if payload.get("exp", 0) > time.time():
+                _token_cache.move_to_end(token)
+                return payload
+            del _token_cache[token]
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
     except JWTError:
         return None
+    with _token_lock:
+        _token_cache[token] = payload
+        if len(_token_cache) > TOKEN_CACHE_SIZE:
+            _token_cache.popitem(last=False)
+    return payload
+
+
+def _cached_user(user_id) -> dict | None:
+    with _user_lock:
+        cached = _user_cache.get(user_id)
+    if cached is not None and cached[0] > time.monotonic():
+        return dict(cached[1])
+    return None
+
+
+def get_user(user_id) -> dict | None:
+    # id, name, email and role of a user, served from memory for up to
+    # USER_CACHE_SECONDS. Unknown ids are not cached.
+    user = _cached_user(user_id)
+    if user is not None:
+        return user
+    now = time.monotonic()
+    with pool.reader() as db:
+        row = db.execute(
+            "SELECT id, name, email, role FROM users WHERE id=?", (user_id,)
+        ).fetchone()
+    if not row:
+        invalidate_user(user_id)
+        return None
+    user = {"id": row[0], "name": row[1], "email": row[2], "role": row[3]}
+    with _user_lock:
+        _user_cache[user_id] = (now + USER_CACHE_SECONDS, user)
+    return dict(user)
 
 
-def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: sqlite3.Connection = Depends(get_db),
-):
+def invalidate_user(user_id=None) -> None:
+    # Drops one cached user, or all of them when no id is given.
+    with _user_lock:
+        if user_id is None:
+            _user_cache.clear()
+        else:
+            _user_cache.pop(user_id, None)
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme)):
     payload = decode_access_token(token)
     if not payload:
         raise HTTPException(
             status_code=401, detail="Invalid authentication credentials."
         )
-    c = db.cursor()
-    c.execute(
-        "SELECT id, name, email, role FROM users WHERE id=?", (payload["id"],)
-    )
-    user = c.fetchone()
+    # Cache hits are answered without leaving the event loop.
+    user = _cached_user(payload.get("id"))
+    if user is None:
+        user = await run_read(get_user, payload.get("id"))
     if not user:
         raise HTTPException(status_code=401, detail="User not found.")
-    return {"id": user[0], "name": user[1], "email": user[2], "role": user[3]}
+    return user
 
 
 @router.post("/auth/register", response_model=UserOut)
-def register(user: UserCreate, db: sqlite3.Connection = Depends(get_db)):
-    c = db.cursor()
-    c.execute("SELECT id FROM users WHERE email=?", (user.email,))
-    if c.fetchone():
-        raise HTTPException(
-            status_code=400, detail="Email already registered."
-        )
-    if len(user.password) < 8:
-        raise HTTPException(
-            status_code=400, detail="Password must be at least 8 characters."
-        )
-    hashed_password = get_password_hash(user.password)
-    safe_role = "user"
-    c.execute(
-        (
-            "INSERT INTO users (name, email, password, role, verified) "
-            "VALUES (?, ?, ?, ?, ?)"
-        ),
-        (user.name, user.email, hashed_password, safe_role, True),
-    )
-    db.commit()
-    user_id = c.lastrowid
-    return UserOut(
-        id=user_id,
-        name=user.name,
-        email=user.email,
-        role=safe_role,
-        verified=True,
-    )
+async def register(user: UserCreate, request: Request):
+    ip = _client_ip(request)
+    _check_throttle(_ip_attempts, ip)
+    _ip_attempts.hit(ip)
+    return await _create_user(user.name, user.email, user.password, "user")
 
 
 @router.post("/auth/admin/create", response_model=UserOut)
-def admin_create_user(
+async def admin_create_user(
     user: AdminCreateUser,
     current_user: dict = Depends(get_current_user),
-    db: sqlite3.Connection = Depends(get_db),
 ):
     if current_user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Admin role required.")
@@ -137,56 +280,49 @@ def admin_create_user(
     if user.role not in {"user", "admin"}:
         raise HTTPException(status_code=400, detail="Invalid role.")
 
-    if len(user.password) < 8:
-        raise HTTPException(
-            status_code=400,
-            detail="Password must be at least 8 characters.",
-        )
-
-    c = db.cursor()
-    c.execute("SELECT id FROM users WHERE email=?", (user.email,))
-    if c.fetchone():
-        raise HTTPException(
-            status_code=400, detail="Email already registered."
-        )
-
-    hashed_password = get_password_hash(user.password)
-    c.execute(
-        (
-            "INSERT INTO users (name, email, password, role, verified) "
-            "VALUES (?, ?, ?, ?, ?)"
-        ),
-        (user.name, user.email, hashed_password, user.role, True),
-    )
-    db.commit()
-    user_id = c.lastrowid
-    return UserOut(
-        id=user_id,
-        name=user.name,
-        email=user.email,
-        role=user.role,
-        verified=True,
+    return await _create_user(
+        user.name, user.email, user.password, user.role
     )
 
 
 @router.post("/auth/login")
-def login(
+async def login(
+    request: Request,
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: sqlite3.Connection = Depends(get_db),
 ):
-    c = db.cursor()
-    c.execute(
+    ip = _client_ip(request)
+    account = form_data.username.strip().lower()
+    _check_throttle(_ip_attempts, ip)
+    _check_throttle(_account_failures, account)
+    _ip_attempts.hit(ip)
+    user = await fetch_one(
         (
             "SELECT id, name, email, password, role, verified "
             "FROM users WHERE email=?"
         ),
         (form_data.username,),
     )
-    user = c.fetchone()
-    if not user or not verify_password(form_data.password, user[3]):
+    matches, new_hash = False, None
+    if user:
+        try:
+            matches, new_hash = await verify_password(
+                form_data.password, user[3]
+            )
+        except PasswordBusy:
+            raise _password_busy()
+    if not matches:
+        _account_failures.hit(account)
         raise HTTPException(
             status_code=401, detail="Incorrect email or password."
         )
+    _account_failures.clear(account)
+    if new_hash:
+        # The stored hash used an older cost factor; swap it unless the
+        # password changed in the meantime.
+        await execute(
+            "UPDATE users SET password=? WHERE id=? AND password=?",
+            (new_hash, user[0], user[3]),
+        )
     if not user[5]:
         raise HTTPException(status_code=403, detail="Account not verified.")
     access_token = create_access_token(
@@ -10,8 +10,11 @@ class SharedCamera:
         self.index = index
         self.cap = None
         self._frame = None
+        self._captured_at = 0.0
+        self._seq = 0
         self._running = False
         self._lock = threading.Lock()
+        self._frame_ready = threading.Condition(self._lock)
         self._state_lock = threading.Lock()
         self._thread = None
 
@@ -43,8 +46,12 @@ class SharedCamera:
         while self._running and self.cap is not None:
             ok, frame = self.cap.read()
             if ok:
-                with self._lock:
+                captured_at = time.monotonic()
+                with self._frame_ready:
                     self._frame = frame
+                    self._captured_at = captured_at
+                    self._seq += 1
+                    self._frame_ready.notify_all()
             else:
                 time.sleep(0.02)
 
@@ -54,6 +61,18 @@ class SharedCamera:
                 return None
             return self._frame.copy()
 
+    def wait_for_frame(self, after_seq: int, timeout_seconds: float):
+        # Blocks until a frame newer than after_seq is captured so that
+        # consumers never process the same frame twice.
+        deadline = time.monotonic() + timeout_seconds
+        with self._frame_ready:
+            while self._frame is None or self._seq <= after_seq:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._frame_ready.wait(remaining)
+            return self._frame.copy(), self._captured_at, self._seq
+
     def stop(self) -> None:
         with self._state_lock:
             self._stop_unlocked()
@@ -108,3 +127,9 @@ def get_frame(timeout_seconds: float = 1.0):
             return frame
         time.sleep(0.01)
     return None
+
+
+def get_frame_after(last_seq: int = 0, timeout_seconds: float = 1.0):
+    # Returns (frame, captured_at, seq) with a time.monotonic() capture
+    # timestamp, or None if no newer frame arrived before the timeout.
+    return _shared_camera.wait_for_frame(last_seq, timeout_seconds)
@@ -1,28 +1,83 @@
 # cameras.py - Camera management endpoints
 from fastapi import APIRouter
+from clip_buffer import DEFAULT_PREROLL_SECONDS
+from clip_encoder import DEFAULT_CLIP_SETTINGS
+from frame_scheduler import (
+    DEFAULT_CAMERA_PRIORITY,
+    DEFAULT_FRAME_DEADLINE_MS,
+)
+from load_controller import DEFAULT_LATENCY_TARGET_MS
 
 router = APIRouter()
 
+# Tiled inference is opt-in per camera; enable it for high-resolution
+# cameras where small PPE items disappear at the default imgsz.
+DEFAULT_TILING = {
+    "enabled": False,
+    "tile_size": 640,
+    "overlap": 0.2,
+    "iou_threshold": 0.5,
+    "include_full_frame": True,
+}
+
+# Frames older than frame_deadline_ms are dropped, and when inference slots
+# are contended higher priority cameras (e.g. fire zones) go first.
+# Incident clips start preroll_seconds before the anomaly was confirmed and
+# are encoded with the codec, fps, bitrate and max_width in "clip".
+
 # Demo camera list with location info for map integration
 CAMERAS = [
     {
         "id": 0,
         "name": "Main Entrance",
         "location": {"lat": 28.6139, "lng": 77.2090},
+        "tiling": dict(DEFAULT_TILING),
+        "latency_target_ms": DEFAULT_LATENCY_TARGET_MS,
+        "priority": DEFAULT_CAMERA_PRIORITY,
+        "frame_deadline_ms": DEFAULT_FRAME_DEADLINE_MS,
+        "preroll_seconds": DEFAULT_PREROLL_SECONDS,
+        "clip": dict(DEFAULT_CLIP_SETTINGS),
     },
     {
         "id": 1,
         "name": "Warehouse",
         "location": {"lat": 28.6140, "lng": 77.2085},
+        "tiling": dict(DEFAULT_TILING),
+        "latency_target_ms": DEFAULT_LATENCY_TARGET_MS,
+        "priority": DEFAULT_CAMERA_PRIORITY,
+        "frame_deadline_ms": DEFAULT_FRAME_DEADLINE_MS,
+        "preroll_seconds": DEFAULT_PREROLL_SECONDS,
+        "clip": dict(DEFAULT_CLIP_SETTINGS),
     },
     {
         "id": 2,
         "name": "Exit Gate",
         "location": {"lat": 28.6135, "lng": 77.2095},
+        "tiling": dict(DEFAULT_TILING),
+        "latency_target_ms": DEFAULT_LATENCY_TARGET_MS,
+        "priority": DEFAULT_CAMERA_PRIORITY,
+        "frame_deadline_ms": DEFAULT_FRAME_DEADLINE_MS,
+        "preroll_seconds": DEFAULT_PREROLL_SECONDS,
+        "clip": dict(DEFAULT_CLIP_SETTINGS),
     },
 ]
 
 
+def get_camera_config(camera_id: int | None) -> dict:
+    for camera in CAMERAS:
+        if camera["id"] == camera_id:
+            return camera
+    return {
+        "id": camera_id,
+        "tiling": dict(DEFAULT_TILING),
+        "latency_target_ms": DEFAULT_LATENCY_TARGET_MS,
+        "priority": DEFAULT_CAMERA_PRIORITY,
+        "frame_deadline_ms": DEFAULT_FRAME_DEADLINE_MS,
+        "preroll_seconds": DEFAULT_PREROLL_SECONDS,
+        "clip": dict(DEFAULT_CLIP_SETTINGS),
+    }
+
+
 @router.get("/cameras")
 def get_cameras():
     return CAMERAS
@@ -0,0 +1,49 @@
+import threading
+from collections import deque
+
+
+DEFAULT_PREROLL_SECONDS = 10.0
+# Hard cap so a misbehaving camera clock cannot grow the buffer unbounded.
+MAX_BUFFER_FPS = 60
+
+
+class EncodedFrameBuffer:
+    # Rolling window of JPEG-encoded frames used as incident clip pre-roll.
+    # Encoded frames are roughly 20-40x smaller than raw BGR frames.
+    def __init__(self, window_seconds: float = DEFAULT_PREROLL_SECONDS):
+        self.window_seconds = float(window_seconds)
+        self._frames: deque[tuple[float, bytes]] = deque(
+            maxlen=max(1, int(self.window_seconds * MAX_BUFFER_FPS))
+        )
+        self._lock = threading.Lock()
+
+    def append(self, captured_at: float, jpeg_bytes: bytes) -> None:
+        with self._lock:
+            self._frames.append((captured_at, jpeg_bytes))
+            cutoff = captured_at - self.window_seconds
+            while self._frames and self._frames[0][0] < cutoff:
+                self._frames.popleft()
+
+    def snapshot(self) -> list[tuple[float, bytes]]:
+        with self._lock:
+            return list(self._frames)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._frames.clear()
+
+
+_buffers: dict[int | None, EncodedFrameBuffer] = {}
+_buffers_lock = threading.Lock()
+
+
+def get_clip_buffer(
+    camera_id: int | None,
+    preroll_seconds: float = DEFAULT_PREROLL_SECONDS,
+) -> EncodedFrameBuffer:
+    with _buffers_lock:
+        buffer = _buffers.get(camera_id)
+        if buffer is None or buffer.window_seconds != float(preroll_seconds):
+            buffer = EncodedFrameBuffer(preroll_seconds)
+            _buffers[camera_id] = buffer
+        return buffer
@@ -0,0 +1,158 @@
+import os
+import shutil
+import subprocess
+
+import cv2
+import numpy as np
+
+
+DEFAULT_CLIP_SETTINGS = {
+    # "h264" uses ffmpeg when available and falls back to OpenCV.
+    "codec": "h264",
+    "fps": 15.0,
+    "bitrate": None,
+    "max_width": 1280,
+}
+FFMPEG_PATH = os.getenv("FFMPEG_PATH") or shutil.which("ffmpeg")
+
+
+def resample_frames(encoded_frames, fps: float):
+    # Turns (capture timestamp, frame) pairs into a constant frame rate
+    # sequence, repeating or skipping frames so the clip plays back at the
+    # speed it was captured. Frames without a timestamp are assumed to be
+    # evenly spaced at the output rate.
+    interval = 1.0 / fps
+    previous = None
+    next_tick = None
+    for index, (captured_at, data) in enumerate(encoded_frames):
+        if not captured_at or captured_at <= 0:
+            captured_at = index * interval
+        if next_tick is None:
+            next_tick = captured_at
+        while previous is not None and next_tick < captured_at:
+            yield previous
+            next_tick += interval
+        previous = data
+    if previous is not None:
+        yield previous
+
+
+def _ffmpeg_command(path: str, settings: dict) -> list[str]:
+    command = [
+        FFMPEG_PATH,
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-y",
+        "-f",
+        "image2pipe",
+        "-c:v",
+        "mjpeg",
+        "-framerate",
+        str(settings["fps"]),
+        "-i",
+        "-",
+        "-c:v",
+        "libx264",
+        "-preset",
+        "veryfast",
+        "-pix_fmt",
+        "yuv420p",
+    ]
+    if settings.get("bitrate"):
+        command += ["-b:v", str(settings["bitrate"])]
+    else:
+        command += ["-crf", "23"]
+    max_width = settings.get("max_width")
+    if max_width:
+        scale = f"scale='min({int(max_width)},iw)':-2"
+    else:
+        scale = "scale=trunc(iw/2)*2:trunc(ih/2)*2"
+    # Fast start moves the index to the front so browsers can begin
+    # playback before the download completes.
+    command += ["-vf", scale, "-movflags", "+faststart", path]
+    return command
+
+
+def _encode_ffmpeg(frames, path: str, settings: dict) -> bool:
+    process = subprocess.Popen(
+        _ffmpeg_command(path, settings),
+        stdin=subprocess.PIPE,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    written = 0
+    try:
+        for data in frames:
+            process.stdin.write(data)
+            written += 1
+        process.stdin.close()
+    except BrokenPipeError:
+        pass
+    _, stderr = process.communicate()
+    if not written:
+        return False
+    if process.returncode != 0:
+        message = stderr.decode("utf-8", "replace").strip()
+        raise RuntimeError(f"ffmpeg failed: {message}")
+    return True
+
+
+def _encode_opencv(frames, path: str, settings: dict) -> bool:
+    fourccs = ["avc1", "mp4v"] if settings["codec"] == "h264" else ["mp4v"]
+    max_width = settings.get("max_width")
+    out = None
+    size = None
+    written = 0
+    try:
+        for data in frames:
+            frame = cv2.imdecode(
+                np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR
+            )
+            if frame is None:
+                continue
+            height, width = frame.shape[:2]
+            if max_width and width > max_width:
+                height = int(height * max_width / width)
+                width = int(max_width)
+                frame = cv2.resize(frame, (width, height))
+            if out is None:
+                size = (width, height)
+                for fourcc in fourccs:
+                    out = cv2.VideoWriter(
+                        path,
+                        cv2.VideoWriter_fourcc(*fourcc),
+                        float(settings["fps"]),
+                        size,
+                    )
+                    if out.isOpened():
+                        break
+                    out.release()
+                else:
+                    # Writing on would drop every frame and still count
+                    # them; fail so the job is retried or dead-lettered.
+                    out = None
+                    raise RuntimeError(
+                        f"No video writer could open {path} "
+                        f"({', '.join(fourccs)})"
+                    )
+            elif (width, height) != size:
+                frame = cv2.resize(frame, size)
+            out.write(frame)
+            written += 1
+    finally:
+        if out is not None:
+            out.release()
+    return written > 0
+
+
+def encode_clip(
+    encoded_frames, path: str, settings: dict | None = None
+) -> bool:
+    # encoded_frames yields (capture timestamp, JPEG bytes) pairs.
+    settings = {**DEFAULT_CLIP_SETTINGS, **(settings or {})}
+    settings["fps"] = float(settings.get("fps") or 15.0)
+    frames = resample_frames(encoded_frames, settings["fps"])
+    if settings["codec"] == "h264" and FFMPEG_PATH:
+        return _encode_ffmpeg(frames, path, settings)
+    return _encode_opencv(frames, path, settings)
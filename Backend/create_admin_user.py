@@ -1,13 +1,10 @@
 import sqlite3
 import os
-from passlib.context import CryptContext
 from dotenv import load_dotenv
+from passwords import pwd_context
 
 load_dotenv(os.path.join(os.path.dirname(__file__), ".env"))
 
-# Set up password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 
 def get_password_hash(password):
     return pwd_context.hash(password)
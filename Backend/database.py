@@ -1,5 +1,10 @@
+import asyncio
+import functools
 import os
-import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+from db_pool import DB_READERS, ConnectionPool
+from migrations import check_query_plans, run_migrations
 
 DB_PATH = os.path.abspath(
     os.path.join(os.path.dirname(__file__), "../Database/factory.db")
@@ -7,85 +12,90 @@ DB_PATH = os.path.abspath(
 os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
 
 
-def get_db():
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-    try:
-        yield conn
-    finally:
-        try:
-            conn.close()
-        except sqlite3.ProgrammingError:
-            # FastAPI may finalize dependency cleanup from another thread.
-            # Ignore close-time mismatch to prevent false 500 responses.
-            pass
+pool = ConnectionPool(DB_PATH)
+
+
+# Async routes hand their queries to these threads instead of the shared
+# threadpool, where blocking stream generators could keep them waiting.
+# One thread per reader slot, and one for the single writer connection.
+_read_executor = ThreadPoolExecutor(
+    max_workers=DB_READERS, thread_name_prefix="db-read"
+)
+_write_executor = ThreadPoolExecutor(
+    max_workers=1, thread_name_prefix="db-write"
+)
+
+
+async def _run(executor, fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        executor, functools.partial(fn, *args, **kwargs)
+    )
+
+
+async def run_read(fn, *args, **kwargs):
+    # Runs a blocking function that only reads on a database read thread.
+    return await _run(_read_executor, fn, *args, **kwargs)
+
+
+async def run_write(fn, *args, **kwargs):
+    # Runs a blocking function that writes on the database write thread.
+    return await _run(_write_executor, fn, *args, **kwargs)
+
+
+def _with_reader(fn, *args):
+    with pool.reader() as conn:
+        return fn(conn, *args)
+
+
+def _with_writer(fn, *args):
+    with pool.writer() as conn:
+        return fn(conn, *args)
+
+
+async def read_db(fn, *args):
+    # fn(conn, *args) on a pooled read-only connection.
+    return await run_read(_with_reader, fn, *args)
+
+
+async def write_db(fn, *args):
+    # fn(conn, *args) inside one write transaction, committed unless fn
+    # raises.
+    return await run_write(_with_writer, fn, *args)
+
+
+def _fetch_all(conn, query: str, params) -> list:
+    return conn.execute(query, params).fetchall()
+
+
+def _fetch_one(conn, query: str, params):
+    return conn.execute(query, params).fetchone()
+
+
+def _execute(conn, query: str, params) -> int:
+    return conn.execute(query, params).lastrowid
+
+
+async def fetch_all(query: str, params=()) -> list:
+    return await read_db(_fetch_all, query, params)
+
+
+async def fetch_one(query: str, params=()):
+    return await read_db(_fetch_one, query, params)
+
+
+async def execute(query: str, params=()) -> int:
+    # Single write statement in its own transaction; returns lastrowid.
+    return await write_db(_execute, query, params)
 
 
 def init_db():
-    def ensure_column(cursor, table_name, column_name, definition):
-        cursor.execute(f"PRAGMA table_info({table_name})")
-        columns = {row[1] for row in cursor.fetchall()}
-        if column_name not in columns:
-            cursor.execute(
-                f"ALTER TABLE {table_name} "
-                f"ADD COLUMN {column_name} {definition}"
-            )
-
-    with sqlite3.connect(DB_PATH) as conn:
-        c = conn.cursor()
-        # c.execute('''DROP TABLE IF EXISTS users''')
-        # Do not drop users table.
-        c.execute("""CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            email TEXT NOT NULL UNIQUE,
-            password TEXT NOT NULL,
-            role TEXT DEFAULT 'user',
-            verified INTEGER DEFAULT 0
-        )""")
-        c.execute("""CREATE TABLE IF NOT EXISTS people (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            extra TEXT,
-            admin INTEGER DEFAULT 0
-        )""")
-        c.execute("""CREATE TABLE IF NOT EXISTS incidents (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            type TEXT NOT NULL,
-            description TEXT,
-            status TEXT DEFAULT 'Open',
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            clip_path TEXT
-        )""")
-        ensure_column(c, "incidents", "source", "TEXT DEFAULT 'manual'")
-        ensure_column(c, "incidents", "confidence", "REAL")
-        ensure_column(c, "incidents", "evidence_image", "TEXT")
-        ensure_column(c, "incidents", "report_path", "TEXT")
-        ensure_column(c, "incidents", "camera_id", "INTEGER")
-        ensure_column(c, "incidents", "event_id", "INTEGER")
-        c.execute("""CREATE TABLE IF NOT EXISTS incident_events (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            incident_type TEXT NOT NULL,
-            camera_id INTEGER,
-            state TEXT NOT NULL,
-            started_at TEXT NOT NULL,
-            last_seen_at TEXT NOT NULL,
-            resolved_at TEXT,
-            incident_count INTEGER DEFAULT 0
-        )""")
-        c.execute("""CREATE TABLE IF NOT EXISTS incident_audit (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            incident_id INTEGER,
-            status TEXT,
-            changed_at TEXT
-        )""")
-        c.execute("""CREATE TABLE IF NOT EXISTS feedback (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            incident_id INTEGER,
-            comment TEXT,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        )""")
-        c.execute("""CREATE TABLE IF NOT EXISTS settings (
-            key TEXT PRIMARY KEY,
-            value TEXT
-        )""")
-        conn.commit()
+    with pool.writer() as conn:
+        run_migrations(conn)
+        problems = check_query_plans(conn)
+    if problems:
+        # A hot query that lost its index would quietly slow every request;
+        # refuse to start instead.
+        raise RuntimeError(
+            "Query plans use a full table scan:\n" + "\n".join(problems)
+        )
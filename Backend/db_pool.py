@@ -0,0 +1,145 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+load_dotenv(os.path.join(os.path.dirname(__file__), ".env"))
+
+DB_READERS = max(1, int(os.getenv("DB_READERS", "4")))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "30000"))
+DB_MMAP_BYTES = int(os.getenv("DB_MMAP_BYTES", str(256 * 1024 * 1024)))
+DB_CACHE_KIB = int(os.getenv("DB_CACHE_KIB", str(64 * 1024)))
+# Statements compiled per connection; pooled connections live for the
+# whole process, so hot queries are parsed once and then reused.
+DB_CACHED_STATEMENTS = 256
+
+
+class ConnectionPool:
+    # Readers come from a small pool; all writes go through one connection
+    # guarded by a lock, so writers queue in-process instead of spinning on
+    # SQLITE_BUSY. WAL lets readers keep going while a write is in flight.
+    def __init__(self, path: str, readers: int = DB_READERS):
+        self.path = path
+        self._readers: queue.LifoQueue[sqlite3.Connection] = (
+            queue.LifoQueue()
+        )
+        self._reader_slots = threading.BoundedSemaphore(readers)
+        self._writer: sqlite3.Connection | None = None
+        self._writer_lock = threading.Lock()
+        self._after_commit: list = []
+
+    def _open(self, readonly: bool) -> sqlite3.Connection:
+        # Autocommit mode: transactions are opened explicitly by writer().
+        conn = sqlite3.connect(
+            self.path,
+            timeout=DB_BUSY_TIMEOUT_MS / 1000.0,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=DB_CACHED_STATEMENTS,
+        )
+        conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+        if not readonly:
+            # journal_mode is persistent; setting it from the writer is
+            # enough for every connection opened afterwards.
+            conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA mmap_size={DB_MMAP_BYTES}")
+        conn.execute(f"PRAGMA cache_size=-{DB_CACHE_KIB}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        if readonly:
+            conn.execute("PRAGMA query_only=ON")
+        return conn
+
+    def acquire_reader(self) -> sqlite3.Connection:
+        if not self._reader_slots.acquire(
+            timeout=DB_BUSY_TIMEOUT_MS / 1000.0
+        ):
+            raise sqlite3.OperationalError("No database reader available")
+        try:
+            return self._readers.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            return self._open(readonly=True)
+        except Exception:
+            self._reader_slots.release()
+            raise
+
+    def release_reader(self, conn: sqlite3.Connection) -> None:
+        if conn.in_transaction:
+            conn.rollback()
+        self._readers.put(conn)
+        self._reader_slots.release()
+
+    @contextmanager
+    def reader(self):
+        conn = self.acquire_reader()
+        try:
+            yield conn
+        finally:
+            self.release_reader(conn)
+
+    def acquire_writer(self) -> sqlite3.Connection:
+        # The write lock is taken up front with BEGIN IMMEDIATE so a
+        # transaction never fails halfway through on a lock upgrade.
+        self._writer_lock.acquire()
+        try:
+            if self._writer is None:
+                self._writer = self._open(readonly=False)
+            self._writer.execute("BEGIN IMMEDIATE")
+        except Exception:
+            self._writer_lock.release()
+            raise
+        return self._writer
+
+    def after_commit(self, callback) -> None:
+        # Runs callback once the current write transaction commits, still
+        # under the write lock so the next writer sees its effects. Dropped
+        # if the transaction rolls back. Only valid inside writer().
+        self._after_commit.append(callback)
+
+    def release_writer(self, commit: bool = True) -> None:
+        # May run on a different thread than acquire_writer (FastAPI
+        # finalizes dependencies elsewhere), which a plain Lock allows.
+        conn = self._writer
+        callbacks, self._after_commit = self._after_commit, []
+        try:
+            if conn is not None and conn.in_transaction:
+                if not commit:
+                    conn.execute("ROLLBACK")
+                    return
+                try:
+                    conn.execute("COMMIT")
+                except sqlite3.Error:
+                    if conn.in_transaction:
+                        conn.execute("ROLLBACK")
+                    raise
+            if commit:
+                for callback in callbacks:
+                    callback()
+        finally:
+            self._writer_lock.release()
+
+    @contextmanager
+    def writer(self):
+        conn = self.acquire_writer()
+        try:
+            yield conn
+        except BaseException:
+            self.release_writer(commit=False)
+            raise
+        self.release_writer()
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._writer_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
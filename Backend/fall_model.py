@@ -22,13 +22,13 @@ def unload_fall_model() -> None:
     _fall_model = None
 
 
-def detect_fall(img):
+def detect_fall(img, imgsz=640):
     model = get_fall_model()
     if not model:
         return []
     results = model(
         img,
-        imgsz=640,
+        imgsz=imgsz,
         device="cuda" if cv2.cuda.getCudaEnabledDeviceCount() > 0 else "cpu",
     )
     detections = []
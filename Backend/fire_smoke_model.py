@@ -1,6 +1,7 @@
 import os
 from ultralytics import YOLO
 import torch
+from tiled_inference import predict_tiled, tiling_enabled, tiling_kwargs
 
 MODEL_PATH = os.path.join(
     os.path.dirname(__file__),
@@ -21,15 +22,39 @@ def unload_fire_model() -> None:
     _fire_model = None
 
 
-def detect_fire_smoke(img, conf_threshold=0.15, device=None):
+def detect_fire_smoke(
+    img, conf_threshold=0.15, device=None, tiling=None, imgsz=None
+):
     model = get_fire_model()
     if not model:
         return []
     if device is None:
         device = "cuda" if torch.cuda.is_available() else "cpu"
-    results = model(img, conf=conf_threshold, device=device)
-    detections = []
     model_names = getattr(model, "names", {})
+    if tiling_enabled(tiling):
+        boxes, scores, classes = predict_tiled(
+            model,
+            img,
+            conf=conf_threshold,
+            device=device,
+            **tiling_kwargs(tiling),
+        )
+        return [
+            {
+                "bbox": [int(v) for v in box],
+                "confidence": float(conf),
+                "label": str(model_names.get(int(cls), str(cls)))
+                .strip()
+                .lower(),
+            }
+            for box, conf, cls in zip(boxes, scores, classes)
+            if conf >= conf_threshold
+        ]
+    predict_kwargs = {"imgsz": imgsz} if imgsz else {}
+    results = model(
+        img, conf=conf_threshold, device=device, **predict_kwargs
+    )
+    detections = []
     for r in results:
         boxes = r.boxes
         for box in boxes:
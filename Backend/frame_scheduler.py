@@ -0,0 +1,138 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+
+
+DEFAULT_FRAME_DEADLINE_MS = 500.0
+DEFAULT_CAMERA_PRIORITY = 5
+# Number of frames allowed to run inference at the same time across all
+# cameras. Waiting frames are admitted highest camera priority first.
+INFERENCE_SLOTS = max(1, int(os.getenv("INFERENCE_SLOTS", "1")))
+
+
+class InferenceGate:
+    def __init__(self, slots: int):
+        self._slots = slots
+        self._waiting: list[tuple[int, int]] = []
+        self._tickets = itertools.count()
+        self._cond = threading.Condition()
+
+    def acquire(self, priority: int, deadline: float) -> bool:
+        entry = (-int(priority), next(self._tickets))
+        with self._cond:
+            heapq.heappush(self._waiting, entry)
+            while True:
+                if self._slots > 0 and self._waiting[0] == entry:
+                    heapq.heappop(self._waiting)
+                    self._slots -= 1
+                    if self._slots > 0 and self._waiting:
+                        # The next waiter may take the slot that is left.
+                        self._cond.notify_all()
+                    return True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._waiting.remove(entry)
+                    heapq.heapify(self._waiting)
+                    self._cond.notify_all()
+                    return False
+                self._cond.wait(remaining)
+
+    def release(self) -> None:
+        with self._cond:
+            self._slots += 1
+            self._cond.notify_all()
+
+
+_gate = InferenceGate(INFERENCE_SLOTS)
+
+
+class FrameScheduler:
+    def __init__(
+        self,
+        camera_id: int | None,
+        deadline_ms: float = DEFAULT_FRAME_DEADLINE_MS,
+        priority: int = DEFAULT_CAMERA_PRIORITY,
+    ):
+        self.camera_id = camera_id
+        self.deadline_ms = float(deadline_ms)
+        self.priority = int(priority)
+        self.processed = 0
+        self.dropped = 0
+        self.late = 0
+        self._lock = threading.Lock()
+
+    def configure(self, deadline_ms: float, priority: int) -> None:
+        with self._lock:
+            self.deadline_ms = float(deadline_ms)
+            self.priority = int(priority)
+
+    def _expires_at(self, captured_at: float) -> float:
+        return captured_at + self.deadline_ms / 1000.0
+
+    def admit(self, captured_at: float) -> bool:
+        # Drops frames that are already stale, or that go stale while
+        # waiting for an inference slot behind higher priority cameras.
+        expires_at = self._expires_at(captured_at)
+        if time.monotonic() >= expires_at or not _gate.acquire(
+            self.priority, expires_at
+        ):
+            with self._lock:
+                self.dropped += 1
+            return False
+        return True
+
+    def release(self) -> None:
+        _gate.release()
+
+    def record_finish(self, captured_at: float) -> None:
+        # Counts a frame that finished inference past its deadline. It is
+        # still encoded: the next frame would be at least as late, so
+        # dropping it would only freeze the stream when inference is slow.
+        if time.monotonic() >= self._expires_at(captured_at):
+            with self._lock:
+                self.late += 1
+
+    def mark_processed(self) -> None:
+        with self._lock:
+            self.processed += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "camera_id": self.camera_id,
+                "priority": self.priority,
+                "deadline_ms": self.deadline_ms,
+                "processed": self.processed,
+                "dropped": self.dropped,
+                "late": self.late,
+            }
+
+
+_schedulers: dict[int | None, FrameScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_frame_scheduler(
+    camera_id: int | None,
+    deadline_ms: float = DEFAULT_FRAME_DEADLINE_MS,
+    priority: int = DEFAULT_CAMERA_PRIORITY,
+) -> FrameScheduler:
+    with _schedulers_lock:
+        scheduler = _schedulers.get(camera_id)
+        if scheduler is None:
+            scheduler = FrameScheduler(camera_id, deadline_ms, priority)
+            _schedulers[camera_id] = scheduler
+        elif (
+            scheduler.deadline_ms != float(deadline_ms)
+            or scheduler.priority != int(priority)
+        ):
+            scheduler.configure(deadline_ms, priority)
+        return scheduler
+
+
+def get_scheduler_stats() -> list[dict]:
+    with _schedulers_lock:
+        schedulers = list(_schedulers.values())
+    return [scheduler.snapshot() for scheduler in schedulers]
@@ -0,0 +1,170 @@
+import hashlib
+import os
+from email.utils import formatdate, parsedate_to_datetime
+
+from fastapi import Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
+
+from database import fetch_all
+
+# Evidence files are never rewritten: their names carry the capture time.
+IMMUTABLE_CACHE = "private, max-age=31536000, immutable"
+# Lists can change at any moment; clients revalidate with the validators.
+REVALIDATE_CACHE = "private, no-cache"
+RANGE_CHUNK_BYTES = 64 * 1024
+
+
+def _http_date(timestamp: float) -> str:
+    return formatdate(timestamp, usegmt=True)
+
+
+def _opaque_tag(tag: str) -> str:
+    # If-None-Match uses weak comparison: W/"x" matches "x".
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def not_modified(request: Request, headers: dict) -> bool:
+    # If-None-Match wins over If-Modified-Since, as RFC 9110 requires.
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = {_opaque_tag(tag) for tag in if_none_match.split(",")}
+        return "*" in tags or _opaque_tag(headers["ETag"]) in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if not if_modified_since or "Last-Modified" not in headers:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+        modified = parsedate_to_datetime(headers["Last-Modified"])
+    except (TypeError, ValueError):
+        return False
+    return modified <= since
+
+
+async def list_cache_headers(request: Request, *tables: str) -> dict:
+    # Validators for a response built from `tables`. The counters are read
+    # before the data, so a change racing the query only makes the ETag
+    # older than the body, and the next request fetches again.
+    rows = await fetch_all(
+        (
+            "SELECT version, changed_at FROM table_versions "
+            f"WHERE name IN ({', '.join('?' for _ in tables)}) "
+            "ORDER BY name"
+        ),
+        tables,
+    )
+    # The path is part of the digest: routes like /incidents/audit/{id}
+    # read the same tables with the same (empty) query string.
+    state = ",".join(str(row[0]) for row in rows)
+    digest = hashlib.sha1(
+        (
+            f"{request.url.path}|{','.join(tables)}|{state}|"
+            f"{request.url.query}"
+        ).encode()
+    ).hexdigest()[:20]
+    headers = {"ETag": f'"{digest}"', "Cache-Control": REVALIDATE_CACHE}
+    if rows:
+        headers["Last-Modified"] = _http_date(max(row[1] for row in rows))
+    return headers
+
+
+async def cached_list(
+    request: Request, response: Response, *tables: str
+) -> Response | None:
+    # For list routes returning plain data: a 304 response to return when
+    # the client's copy is current, otherwise None with the validators set
+    # on the route's response.
+    headers = await list_cache_headers(request, *tables)
+    if not_modified(request, headers):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
+def _byte_range(value: str, size: int) -> tuple[int, int] | None:
+    # Parses a single "bytes=" range into inclusive offsets. Returns None
+    # for anything else (multiple ranges included), which is answered with
+    # the whole file; raises ValueError when the range is unsatisfiable.
+    unit, _, spec = value.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, separator, last = spec.strip().partition("-")
+    if not separator or not (first + last).isdigit():
+        return None
+    if not first:
+        # Suffix range: the last N bytes.
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError("Range not satisfiable")
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size:
+        raise ValueError("Range not satisfiable")
+    if end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+def _read_range(path: str, start: int, end: int):
+    with open(path, "rb") as handle:
+        handle.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = handle.read(min(RANGE_CHUNK_BYTES, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def evidence_file_response(
+    request: Request, path: str, media_type: str
+) -> Response:
+    # Serves an evidence file with long-lived caching, conditional GETs and
+    # single byte ranges (video players seek with these).
+    stat = os.stat(path)
+    etag = hashlib.md5(
+        f"{stat.st_mtime_ns}-{stat.st_size}".encode()
+    ).hexdigest()
+    headers = {
+        "ETag": f'"{etag}"',
+        "Last-Modified": _http_date(stat.st_mtime),
+        "Cache-Control": IMMUTABLE_CACHE,
+        "Accept-Ranges": "bytes",
+    }
+    if not_modified(request, headers):
+        return Response(status_code=304, headers=headers)
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    # A stale If-Range means the client's partial copy is outdated; it
+    # gets the whole file instead.
+    if range_header and (
+        if_range is None
+        or if_range in (headers["ETag"], headers["Last-Modified"])
+    ):
+        try:
+            byte_range = _byte_range(range_header, stat.st_size)
+        except ValueError:
+            return Response(
+                status_code=416,
+                headers={
+                    **headers,
+                    "Content-Range": f"bytes */{stat.st_size}",
+                },
+            )
+        if byte_range is not None:
+            start, end = byte_range
+            return StreamingResponse(
+                _read_range(path, start, end),
+                status_code=206,
+                media_type=media_type,
+                headers={
+                    **headers,
+                    "Content-Range": f"bytes {start}-{end}/{stat.st_size}",
+                    "Content-Length": str(end - start + 1),
+                },
+            )
+    return FileResponse(
+        path, media_type=media_type, headers=headers, stat_result=stat
+    )
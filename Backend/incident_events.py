@@ -0,0 +1,217 @@
+import atexit
+import threading
+import time
+from datetime import datetime, timedelta
+
+from database import pool
+
+
+EVENT_IDLE_SECONDS = 45
+# How often idle events are resolved and pending event updates written.
+EVENT_FLUSH_SECONDS = 5.0
+
+
+class _OpenEvent:
+    def __init__(
+        self, event_id: int, state: str, last_seen: datetime, count: int
+    ):
+        self.id = event_id
+        self.state = state
+        self.last_seen = last_seen
+        self.count = count
+
+
+class EventTracker:
+    # Open events per (incident_type, camera_id) live in memory. Incident
+    # creation only inserts a row for a brand new event; state, last_seen_at
+    # and incident_count changes are written in batches by flush(). Memory
+    # is only updated after the incident's transaction commits.
+    def __init__(self, idle_seconds: float = EVENT_IDLE_SECONDS):
+        self.idle = timedelta(seconds=idle_seconds)
+        self._lock = threading.Lock()
+        self._open: dict[tuple, _OpenEvent] = {}
+        self._dirty: dict[int, _OpenEvent] = {}
+        self._resolved: dict[int, str] = {}
+        self._loaded = False
+
+    def _load(self, cursor) -> None:
+        # Rebuild from the database. Changes not yet flushed are newer than
+        # the rows, and older builds could leave several open events per
+        # key, of which only the newest one is continued.
+        cursor.execute(
+            "SELECT id, incident_type, camera_id, state, last_seen_at, "
+            "incident_count FROM incident_events "
+            "WHERE state IN ('start','active') ORDER BY id"
+        )
+        self._open.clear()
+        for row in cursor.fetchall():
+            event_id, incident_type, camera_id, state, last_seen, count = row
+            if event_id in self._resolved:
+                continue
+            key = (incident_type, camera_id)
+            previous = self._open.get(key)
+            if previous is not None:
+                self._resolve(key, previous, datetime.utcnow().isoformat())
+            self._open[key] = self._dirty.get(event_id) or _OpenEvent(
+                event_id,
+                state,
+                datetime.fromisoformat(last_seen),
+                int(count or 0),
+            )
+        self._loaded = True
+
+    def assign(
+        self,
+        cursor,
+        incident_type: str,
+        camera_id: int | None,
+        now: datetime,
+    ) -> int:
+        # Must run inside the pool's writer transaction that inserts the
+        # incident; the cursor is only used to load state and to insert
+        # new events. The in-memory changes are applied once that
+        # transaction commits, so a rollback leaves nothing behind.
+        key = (incident_type, camera_id)
+        with self._lock:
+            if not self._loaded:
+                self._load(cursor)
+            event = self._open.get(key)
+        if event is not None and now - event.last_seen <= self.idle:
+            pool.after_commit(lambda: self._seen(event, now))
+            return event.id
+
+        now_iso = now.isoformat()
+        cursor.execute(
+            (
+                "INSERT INTO incident_events "
+                "(incident_type, camera_id, state, started_at, "
+                "last_seen_at, incident_count) "
+                "VALUES (?, ?, 'start', ?, ?, 1)"
+            ),
+            (incident_type, camera_id, now_iso, now_iso),
+        )
+        started = _OpenEvent(int(cursor.lastrowid), "start", now, 1)
+        pool.after_commit(lambda: self._started(key, event, started, now_iso))
+        return started.id
+
+    def _seen(self, event: _OpenEvent, now: datetime) -> None:
+        with self._lock:
+            event.state = "active"
+            event.last_seen = max(event.last_seen, now)
+            event.count += 1
+            self._dirty[event.id] = event
+
+    def _started(
+        self,
+        key: tuple,
+        previous: _OpenEvent | None,
+        event: _OpenEvent,
+        now_iso: str,
+    ) -> None:
+        with self._lock:
+            if previous is not None and self._open.get(key) is previous:
+                self._resolve(key, previous, now_iso)
+            self._open[key] = event
+
+    def load(self, cursor) -> None:
+        with self._lock:
+            self._load(cursor)
+
+    def _resolve(self, key: tuple, event: _OpenEvent, now_iso: str) -> None:
+        # Pending updates stay queued; flush() writes them before resolving.
+        del self._open[key]
+        self._resolved[event.id] = now_iso
+
+    def resolve_idle(self, now: datetime | None = None) -> int:
+        now = now or datetime.utcnow()
+        now_iso = now.isoformat()
+        with self._lock:
+            idle = [
+                (key, event)
+                for key, event in self._open.items()
+                if now - event.last_seen > self.idle
+            ]
+            for key, event in idle:
+                self._resolve(key, event, now_iso)
+        return len(idle)
+
+    def flush(self) -> None:
+        with self._lock:
+            dirty = list(self._dirty.values())
+            resolved = dict(self._resolved)
+            self._dirty.clear()
+            self._resolved.clear()
+        if not dirty and not resolved:
+            return
+        try:
+            with pool.writer() as conn:
+                conn.executemany(
+                    (
+                        "UPDATE incident_events "
+                        "SET state=?, last_seen_at=?, incident_count=? "
+                        "WHERE id=? AND state IN ('start','active')"
+                    ),
+                    [
+                        (
+                            event.state,
+                            event.last_seen.isoformat(),
+                            event.count,
+                            event.id,
+                        )
+                        for event in dirty
+                    ],
+                )
+                conn.executemany(
+                    (
+                        "UPDATE incident_events "
+                        "SET state='resolved', resolved_at=? "
+                        "WHERE id=? AND state IN ('start','active')"
+                    ),
+                    [
+                        (resolved_at, event_id)
+                        for event_id, resolved_at in resolved.items()
+                    ],
+                )
+        except Exception:
+            # Keep the batch for the next flush. The events are shared
+            # objects, so re-queuing them picks up any newer changes too.
+            with self._lock:
+                for event in dirty:
+                    self._dirty.setdefault(event.id, event)
+                for event_id, resolved_at in resolved.items():
+                    self._resolved.setdefault(event_id, resolved_at)
+            raise
+
+
+event_tracker = EventTracker()
+_flusher_started = False
+_flusher_lock = threading.Lock()
+
+
+def _flush_loop() -> None:
+    while True:
+        time.sleep(EVENT_FLUSH_SECONDS)
+        try:
+            flush_events()
+        except Exception as e:  # noqa: BLE001
+            print(f"Failed to flush incident events: {e}")
+
+
+def flush_events() -> None:
+    event_tracker.resolve_idle()
+    event_tracker.flush()
+
+
+def start_event_flusher() -> None:
+    global _flusher_started
+    with _flusher_lock:
+        if _flusher_started:
+            return
+        with pool.reader() as conn:
+            event_tracker.load(conn.cursor())
+        atexit.register(flush_events)
+        threading.Thread(
+            target=_flush_loop, name="incident-events", daemon=True
+        ).start()
+        _flusher_started = True
+
@@ -1,5 +1,6 @@
 import json
 import os
+import uuid
 from datetime import datetime
 
 
@@ -9,10 +10,23 @@ REPORTS_DIR = os.path.abspath(
 os.makedirs(REPORTS_DIR, exist_ok=True)
 
 
-def generate_incident_report(incident: dict) -> str:
-    incident_id = incident.get("id", "unknown")
-    timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-    filename = f"incident_{incident_id}_{timestamp}.json"
+def incident_report_name(incident_id: int, created_at: str | None) -> str:
+    # Derived from the row alone, so the name can be stored in the insert
+    # and the file rendered after the transaction commits.
+    try:
+        created = datetime.fromisoformat(str(created_at))
+    except ValueError:
+        created = datetime.utcnow()
+    return f"incident_{incident_id}_{created.strftime('%Y%m%d_%H%M%S')}.json"
+
+
+def generate_incident_report(
+    incident: dict, filename: str | None = None
+) -> str:
+    if filename is None:
+        filename = incident_report_name(
+            incident.get("id", "unknown"), incident.get("created_at")
+        )
     path = os.path.join(REPORTS_DIR, filename)
 
     report_payload = {
@@ -27,7 +41,11 @@ def generate_incident_report(incident: dict) -> str:
         },
     }
 
-    with open(path, "w", encoding="utf-8") as f:
+    # Written under a temporary name and renamed, so a request for the
+    # report never sees a partial file.
+    temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
         json.dump(report_payload, f, indent=2)
+    os.replace(temp_path, path)
 
     return filename
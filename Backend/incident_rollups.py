@@ -0,0 +1,159 @@
+import sys
+from collections import Counter
+
+
+# Rollup rows are keyed by time bucket plus every dimension. camera_id and
+# source are stored with sentinels so the composite key never holds NULL,
+# which SQLite would treat as distinct in the upsert conflict target.
+ROLLUP_TABLES = {
+    "hour": "incident_rollup_hourly",
+    "day": "incident_rollup_daily",
+}
+# created_at is "YYYY-MM-DD HH:MM:SS"; buckets are its leading characters.
+BUCKET_LENGTHS = {"hour": 13, "day": 10}
+BUCKET_FORMATS = {"hour": "%Y-%m-%d %H", "day": "%Y-%m-%d"}
+ROLLUP_DIMENSIONS = ("type", "camera_id", "source", "status")
+# Incident columns needed to find an incident's rollup rows.
+ROLLUP_FIELDS = ("created_at",) + ROLLUP_DIMENSIONS
+NO_CAMERA = -1
+
+
+def _bucket_keys(incident: dict, status: str) -> list[tuple]:
+    created_at = str(incident["created_at"])
+    camera_id = incident.get("camera_id")
+    return [
+        (
+            table,
+            created_at[: BUCKET_LENGTHS[granularity]],
+            incident["type"],
+            NO_CAMERA if camera_id is None else camera_id,
+            incident.get("source") or "",
+            status,
+        )
+        for granularity, table in ROLLUP_TABLES.items()
+    ]
+
+
+def _apply(cursor, changes: list[tuple[dict, str, int]]) -> None:
+    # changes are (incident, status, delta). Deltas landing on the same
+    # rollup row are summed first, then each table gets one executemany.
+    deltas = Counter()
+    for incident, status, delta in changes:
+        for key in _bucket_keys(incident, status):
+            deltas[key] += delta
+    for table in ROLLUP_TABLES.values():
+        rows = [
+            key[1:] + (delta,)
+            for key, delta in deltas.items()
+            if key[0] == table and delta
+        ]
+        if not rows:
+            continue
+        cursor.executemany(
+            (
+                f"INSERT INTO {table} "
+                "(bucket, type, camera_id, source, status, count) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (bucket, type, camera_id, source, status) "
+                "DO UPDATE SET count = count + excluded.count"
+            ),
+            rows,
+        )
+
+
+def record_incident(cursor, incident: dict) -> None:
+    # Call in the transaction that inserts the incident.
+    _apply(cursor, [(incident, incident["status"], 1)])
+
+
+def record_status_changes(
+    cursor, incidents: list[dict], new_status: str
+) -> None:
+    # Counts stay attributed to the bucket each incident was created in.
+    changes = []
+    for incident in incidents:
+        old_status = incident["status"] or "Open"
+        if old_status != new_status:
+            changes.append((incident, old_status, -1))
+            changes.append((incident, new_status, 1))
+    _apply(cursor, changes)
+
+
+def record_deletions(cursor, incidents: list[dict]) -> None:
+    _apply(
+        cursor,
+        [
+            (incident, incident["status"] or "Open", -1)
+            for incident in incidents
+        ],
+    )
+
+
+def create_rollup_tables(cursor) -> None:
+    for table in ROLLUP_TABLES.values():
+        cursor.execute(f"""CREATE TABLE IF NOT EXISTS {table} (
+            bucket TEXT NOT NULL,
+            type TEXT NOT NULL,
+            camera_id INTEGER NOT NULL,
+            source TEXT NOT NULL,
+            status TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (bucket, type, camera_id, source, status)
+        ) WITHOUT ROWID""")
+
+
+def backfill_rollups(cursor) -> None:
+    # Rebuilds both rollup tables from incidents.
+    for granularity, table in ROLLUP_TABLES.items():
+        cursor.execute(f"DELETE FROM {table}")
+        cursor.execute(
+            f"INSERT INTO {table} "
+            "(bucket, type, camera_id, source, status, count) "
+            f"SELECT substr(created_at, 1, {BUCKET_LENGTHS[granularity]}), "
+            f"type, COALESCE(camera_id, {NO_CAMERA}), COALESCE(source, ''), "
+            "COALESCE(status, 'Open'), COUNT(*) "
+            "FROM incidents GROUP BY 1, 2, 3, 4, 5"
+        )
+
+
+def query_stats(
+    conn,
+    granularity: str,
+    group_by: tuple[str, ...],
+    filters: list[str],
+    params: list,
+) -> list[dict]:
+    # One row per bucket and combination of the group_by dimensions.
+    columns = ", ".join(("bucket",) + group_by)
+    query = f"SELECT {columns}, SUM(count) FROM {ROLLUP_TABLES[granularity]}"
+    if filters:
+        query += " WHERE " + " AND ".join(filters)
+    query += f" GROUP BY {columns} HAVING SUM(count) > 0 ORDER BY {columns}"
+    stats = []
+    for row in conn.execute(query, params).fetchall():
+        item = dict(zip(("bucket",) + group_by, row[:-1]))
+        if item.get("camera_id") == NO_CAMERA:
+            item["camera_id"] = None
+        item["count"] = row[-1]
+        stats.append(item)
+    return stats
+
+
+if __name__ == "__main__":
+    # Rebuild the rollups from existing incidents:
+    # python incident_rollups.py --backfill
+    if "--backfill" not in sys.argv[1:]:
+        print("Usage: python incident_rollups.py --backfill")
+        sys.exit(2)
+    # Imported here: database imports migrations, which imports this module.
+    from database import pool
+
+    with pool.writer() as conn:
+        create_rollup_tables(conn.cursor())
+        backfill_rollups(conn.cursor())
+        counts = {
+            table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ROLLUP_TABLES.values()
+        }
+    for table, count in counts.items():
+        print(f"{table}: {count} rows")
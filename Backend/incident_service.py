@@ -1,64 +1,238 @@
-import sqlite3
-from datetime import datetime
+import base64
+import binascii
+import html
+import sys
+from datetime import datetime, timedelta, timezone
 
-from database import DB_PATH
-from incident_report import generate_incident_report
+from database import pool
+from incident_events import event_tracker
+from incident_report import incident_report_name
+from incident_rollups import record_incident
 
 
-EVENT_IDLE_SECONDS = 45
+INCIDENT_FIELDS = (
+    "id",
+    "type",
+    "description",
+    "status",
+    "created_at",
+    "clip_path",
+    "source",
+    "confidence",
+    "evidence_image",
+    "report_path",
+    "camera_id",
+    "event_id",
+    "updated_at",
+)
+INCIDENT_COLUMNS = ", ".join(INCIDENT_FIELDS)
+VALID_STATUSES = {"Open", "In Progress", "Closed"}
+VALID_TYPES = {"ppe", "fire-smoke", "fall", "pose", "manual"}
+# incidents.created_at comes from SQLite's CURRENT_TIMESTAMP.
+CREATED_AT_FORMAT = "%Y-%m-%d %H:%M:%S"
+# Evaluated by SQLite inside the write transaction. Millisecond resolution,
+# so commits close together can share a stamp; delta sync orders by
+# change_seq instead.
+UPDATED_AT_SQL = "strftime('%Y-%m-%dT%H:%M:%f', 'now')"
+# The change sequence of the current write transaction, after
+# bump_change_seq(). Writers are serialized, so every commit gets a higher
+# number than anything already committed; rows changed together share it.
+CHANGE_SEQ_SQL = (
+    "(SELECT version FROM table_versions WHERE name='incident_changes')"
+)
+# Match markers used inside SQLite, swapped for <mark> tags once the text
+# around them is HTML-escaped.
+_MARK_OPEN = "\ue000"
+_MARK_CLOSE = "\ue001"
+# bm25 column weights: description hits rank above comment hits.
+SEARCH_WEIGHTS = (2.0, 1.0)
 
 
-def _resolve_stale_events(cursor, now_iso: str) -> None:
-    cursor.execute(
-        (
-            "UPDATE incident_events "
-            "SET state='resolved', resolved_at=? "
-            "WHERE state IN ('start','active') "
-            "AND ((julianday(?) - julianday(last_seen_at)) * 86400.0) > ?"
-        ),
-        (now_iso, now_iso, EVENT_IDLE_SECONDS),
+def incident_row_to_dict(row, fields=INCIDENT_FIELDS) -> dict:
+    return dict(zip(fields, row))
+
+
+def parse_utc_timestamp(value: str) -> datetime:
+    # Accepts ISO dates and datetimes; returns naive UTC to match storage.
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def time_range_filters(
+    column: str,
+    start: str | None,
+    end: str | None,
+    time_format: str = CREATED_AT_FORMAT,
+    names: tuple[str, str] = ("created_from", "created_to"),
+) -> tuple[list[str], list]:
+    filters = []
+    params = []
+    for value, name, operator in (
+        (start, names[0], ">="),
+        (end, names[1], "<"),
+    ):
+        if not value:
+            continue
+        try:
+            bound = parse_utc_timestamp(value)
+        except ValueError as e:
+            raise ValueError(f"Invalid {name} value") from e
+        if operator == "<" and len(value) == 10:
+            # A bare end date includes the whole day.
+            bound += timedelta(days=1)
+        filters.append(f"{column} {operator} ?")
+        params.append(bound.strftime(time_format))
+    return filters, params
+
+
+def incident_filters(
+    status: str | None = None,
+    incident_type: str | None = None,
+    camera_id: int | None = None,
+    event_id: int | None = None,
+    created_from: str | None = None,
+    created_to: str | None = None,
+) -> tuple[list[str], list]:
+    # WHERE clauses shared by the incident list and the exports. Raises
+    # ValueError with a client-facing message on invalid input.
+    if status and status not in VALID_STATUSES:
+        raise ValueError("Invalid status filter")
+    if incident_type and incident_type not in VALID_TYPES:
+        raise ValueError("Invalid type filter")
+    filters = []
+    params = []
+    for column, value in (
+        ("status", status),
+        ("type", incident_type),
+        ("camera_id", camera_id),
+        ("event_id", event_id),
+    ):
+        if value is not None and value != "":
+            filters.append(f"{column} = ?")
+            params.append(value)
+    range_filters, range_params = time_range_filters(
+        "created_at", created_from, created_to
     )
+    return filters + range_filters, params + range_params
 
 
-def _get_or_create_event(
-    cursor,
-    incident_type: str,
-    camera_id: int | None,
-    now_iso: str,
-) -> int:
+def encode_cursor(value: str, incident_id: int) -> str:
+    raw = f"{value}|{incident_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(token: str) -> tuple[str, int]:
+    try:
+        raw = base64.urlsafe_b64decode(token.encode("ascii")).decode("utf-8")
+        value, incident_id = raw.rsplit("|", 1)
+        return value, int(incident_id)
+    except (ValueError, UnicodeError, binascii.Error) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def bump_change_seq(cursor) -> None:
+    # Call once per write transaction before stamping rows with
+    # CHANGE_SEQ_SQL.
     cursor.execute(
-        (
-            "SELECT id, state, incident_count FROM incident_events "
-            "WHERE incident_type=? "
-            "AND ((camera_id IS NULL AND ? IS NULL) OR camera_id=?) "
-            "AND state IN ('start','active') "
-            "ORDER BY id DESC LIMIT 1"
-        ),
-        (incident_type, camera_id, camera_id),
+        "UPDATE table_versions SET version = version + 1 "
+        "WHERE name='incident_changes'"
     )
-    row = cursor.fetchone()
-    if row:
-        event_id, state, incident_count = row
-        next_state = "active" if state == "start" else state
-        cursor.execute(
-            (
-                "UPDATE incident_events "
-                "SET state=?, last_seen_at=?, incident_count=? "
-                "WHERE id=?"
-            ),
-            (next_state, now_iso, int(incident_count or 0) + 1, event_id),
-        )
-        return int(event_id)
 
-    cursor.execute(
+
+def change_position_at(db, updated_at: str) -> tuple[int, int]:
+    # Delta sync position just before the first change, update or
+    # deletion, stamped at or after `updated_at`, or past everything when
+    # there is none. Stamps and change sequences are both taken inside the
+    # serialized write transaction, so the earliest stamp carries the
+    # lowest sequence and one index seek per table finds it.
+    seqs = []
+    for query in (
+        "SELECT change_seq FROM incidents WHERE updated_at >= ? "
+        "ORDER BY updated_at LIMIT 1",
+        "SELECT change_seq FROM incident_tombstones WHERE deleted_at >= ? "
+        "ORDER BY deleted_at LIMIT 1",
+    ):
+        row = db.execute(query, (updated_at,)).fetchone()
+        if row is not None:
+            seqs.append(row[0])
+    if seqs:
+        return min(seqs) - 1, sys.maxsize
+    seq = db.execute(f"SELECT {CHANGE_SEQ_SQL}").fetchone()[0]
+    return seq, sys.maxsize
+
+
+def _changed_incidents(
+    db, change_seq: int, after_id: int, limit: int
+) -> list:
+    # Keyset scan over (change_seq, id); rows from the same commit are
+    # ordered by id so pages never repeat or skip a row.
+    fields = INCIDENT_FIELDS + ("change_seq",)
+    rows = db.execute(
         (
-            "INSERT INTO incident_events "
-            "(incident_type, camera_id, state, started_at, last_seen_at, "
-            "incident_count) VALUES (?, ?, 'start', ?, ?, 1)"
+            f"SELECT {', '.join(fields)} FROM incidents "
+            "WHERE (change_seq, id) > (?, ?) "
+            "ORDER BY change_seq, id LIMIT ?"
         ),
-        (incident_type, camera_id, now_iso, now_iso),
+        (change_seq, after_id, limit),
+    ).fetchall()
+    return [incident_row_to_dict(row, fields) for row in rows]
+
+
+def _deleted_incidents(
+    db, change_seq: int, up_to: int | None
+) -> tuple[list[int], int]:
+    # Ids of incidents deleted after `change_seq`, up to and including
+    # `up_to` when given, and the change sequence of the last deletion.
+    query = (
+        "SELECT incident_id, change_seq FROM incident_tombstones "
+        "WHERE change_seq > ?"
     )
-    return int(cursor.lastrowid)
+    params = [change_seq]
+    if up_to is not None:
+        query += " AND change_seq <= ?"
+        params.append(up_to)
+    rows = db.execute(query + " ORDER BY change_seq", params).fetchall()
+    return [row[0] for row in rows], rows[-1][1] if rows else change_seq
+
+
+def incident_changes(
+    db,
+    position: tuple[int, int] | None,
+    updated_since: str | None,
+    limit: int,
+) -> tuple[list, list[int], tuple[int, int] | None]:
+    # One delta sync page: incidents changed after `position` (or after
+    # `updated_since`, or from the start), ids deleted in the same range,
+    # and the position to resume from. Everything is read in one
+    # transaction: with separate reads, a deletion committed in between
+    # could move the position past a change this page never saw.
+    db.execute("BEGIN")
+    try:
+        if position is None and updated_since is not None:
+            position = change_position_at(db, updated_since)
+        change_seq, after_id = position or (0, 0)
+        incidents = _changed_incidents(db, change_seq, after_id, limit)
+        has_more = len(incidents) == limit
+        deleted, deleted_seq = [], 0
+        if position is not None:
+            # A fresh client has nothing to drop. Deletions are reported
+            # up to the end of this page, so the next one never repeats
+            # them.
+            deleted, deleted_seq = _deleted_incidents(
+                db,
+                change_seq,
+                incidents[-1]["change_seq"] if has_more else None,
+            )
+    finally:
+        db.execute("COMMIT")
+    if incidents:
+        position = (incidents[-1]["change_seq"], incidents[-1]["id"])
+    if position is not None and deleted_seq > position[0]:
+        # The newest changes were deletions; move past them.
+        position = (deleted_seq, sys.maxsize)
+    return incidents, deleted, position
 
 
 def create_incident(
@@ -69,27 +243,36 @@ def create_incident(
     confidence: float | None = None,
     evidence_image: str | None = None,
     camera_id: int | None = None,
+    job_id: str | None = None,
 ) -> dict:
-    with sqlite3.connect(DB_PATH) as db:
+    # An incident job that is run again (its lease ran out, or the worker
+    # died before completing it) gets back the incident it already made.
+    with pool.writer() as db:
         c = db.cursor()
-        now_iso = datetime.utcnow().isoformat()
+        if job_id is not None:
+            c.execute(
+                f"SELECT {INCIDENT_COLUMNS} FROM incidents WHERE job_id=?",
+                (job_id,),
+            )
+            row = c.fetchone()
+            if row:
+                return incident_row_to_dict(row)
+        bump_change_seq(c)
+        now = datetime.utcnow()
+        now_iso = now.isoformat()
 
         event_id = None
         if source == "auto-monitoring":
-            _resolve_stale_events(c, now_iso)
-            event_id = _get_or_create_event(
-                c,
-                incident_type,
-                camera_id,
-                now_iso,
-            )
+            event_id = event_tracker.assign(c, incident_type, camera_id, now)
 
         c.execute(
             (
                 "INSERT INTO incidents "
                 "(type, description, clip_path, source, confidence, "
-                "evidence_image, camera_id, event_id) "
-                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+                "evidence_image, camera_id, event_id, job_id, "
+                "updated_at, change_seq) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, "
+                f"{UPDATED_AT_SQL}, {CHANGE_SEQ_SQL})"
             ),
             (
                 incident_type,
@@ -100,6 +283,7 @@ def create_incident(
                 evidence_image,
                 camera_id,
                 event_id,
+                job_id,
             ),
         )
         incident_id = c.lastrowid
@@ -109,41 +293,86 @@ def create_incident(
                 "INSERT INTO incident_audit "
                 "(incident_id, status, changed_at) VALUES (?, ?, ?)"
             ),
-            (incident_id, "Open", datetime.utcnow().isoformat()),
+            (incident_id, "Open", now_iso),
         )
 
         c.execute(
-            (
-                "SELECT id, type, description, status, created_at, clip_path, "
-                "source, confidence, evidence_image, report_path, "
-                "camera_id, event_id "
-                "FROM incidents WHERE id=?"
-            ),
+            f"SELECT {INCIDENT_COLUMNS} FROM incidents WHERE id=?",
             (incident_id,),
         )
-        row = c.fetchone()
-
-        incident = {
-            "id": row[0],
-            "type": row[1],
-            "description": row[2],
-            "status": row[3],
-            "created_at": row[4],
-            "clip_path": row[5],
-            "source": row[6],
-            "confidence": row[7],
-            "evidence_image": row[8],
-            "report_path": row[9],
-            "camera_id": row[10],
-            "event_id": row[11],
-        }
-
-        report_name = generate_incident_report(incident)
+        incident = incident_row_to_dict(c.fetchone())
+
+        # Only the name is stored here; the caller renders the file once
+        # the write lock is released.
+        report_name = incident_report_name(incident_id, incident["created_at"])
         c.execute(
             "UPDATE incidents SET report_path=? WHERE id=?",
             (report_name, incident_id),
         )
-        db.commit()
 
         incident["report_path"] = report_name
+        record_incident(c, incident)
         return incident
+
+
+def search_match_expression(text: str) -> str:
+    # Every word must match, as a prefix. Words are quoted so user input
+    # is never parsed as FTS5 query syntax.
+    terms = [
+        '"' + term.replace('"', '""') + '"*' for term in text.split()
+    ]
+    if not terms:
+        raise ValueError("Search text is required")
+    return " ".join(terms)
+
+
+def _marked_html(text: str | None) -> str | None:
+    if text is None:
+        return None
+    return (
+        html.escape(text)
+        .replace(_MARK_OPEN, "<mark>")
+        .replace(_MARK_CLOSE, "</mark>")
+    )
+
+
+def search_incidents(
+    db, text: str, filters: list, params: list, limit: int, offset: int
+) -> list:
+    # Best matches first. Each result carries the description with every
+    # match highlighted, and a snippet of the matching feedback comments.
+    selected = ", ".join(f"i.{field}" for field in INCIDENT_FIELDS)
+    where = "".join(f" AND i.{clause}" for clause in filters)
+    rows = db.execute(
+        (
+            f"SELECT {selected}, "
+            "highlight(incident_search, 0, ?, ?), "
+            "snippet(incident_search, 1, ?, ?, '...', 16) "
+            "FROM incident_search "
+            "JOIN incidents i ON i.id = incident_search.rowid "
+            f"WHERE incident_search MATCH ?{where} "
+            f"ORDER BY bm25(incident_search, {SEARCH_WEIGHTS[0]}, "
+            f"{SEARCH_WEIGHTS[1]}), i.id DESC LIMIT ? OFFSET ?"
+        ),
+        [
+            _MARK_OPEN,
+            _MARK_CLOSE,
+            _MARK_OPEN,
+            _MARK_CLOSE,
+            search_match_expression(text),
+            *params,
+            limit,
+            offset,
+        ],
+    ).fetchall()
+    results = []
+    for row in rows:
+        incident = incident_row_to_dict(row)
+        count = len(INCIDENT_FIELDS)
+        incident["description_highlight"] = _marked_html(row[count])
+        comments = row[count + 1]
+        incident["comment_snippet"] = (
+            _marked_html(comments) if _MARK_OPEN in (comments or "") else None
+        )
+        results.append(incident)
+    return results
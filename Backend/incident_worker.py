@@ -1,105 +1,411 @@
-import asyncio
 import json
 import os
+import socket
+import sqlite3
+import struct
 import threading
 import time
 import uuid
 
+import cv2
 import numpy as np
 
+from cameras import get_camera_config
+from database import pool
+from incident_report import REPORTS_DIR, generate_incident_report
 from incident_service import create_incident
 from incidents_storage import save_incident_clip, save_incident_snapshot
-from realtime import broadcast_incident
+from realtime import publish_incident
 
 
 JOBS_ROOT = os.path.abspath(
     os.path.join(os.path.dirname(__file__), "../Database/incident_jobs")
 )
+# Frame spools live here; job state lives in the incident_jobs table.
 PENDING_DIR = os.path.join(JOBS_ROOT, "pending")
-FAILED_DIR = os.path.join(JOBS_ROOT, "failed")
 MAX_RETRIES = 3
+INCIDENT_WORKERS = max(1, int(os.getenv("INCIDENT_WORKERS", "2")))
+RETRY_BASE_SECONDS = 2.0
+RETRY_MAX_SECONDS = 60.0
+# A claimed job is invisible to other workers until its lease expires, so
+# a worker that dies mid-job has the job picked up again.
+JOB_LEASE_SECONDS = 300.0
+# A running job renews its lease this often, so a slow encode is never
+# mistaken for a dead worker.
+JOB_HEARTBEAT_SECONDS = JOB_LEASE_SECONDS / 3
+# Workers are woken directly for local jobs; this only bounds how long a
+# job enqueued by another process or a delayed retry waits to be claimed.
+JOB_POLL_SECONDS = 1.0
+FRAMES_EXT = ".frames"
+# Each spooled frame is (capture timestamp, JPEG length) followed by the
+# JPEG bytes, so frames can be appended while recording and read back one
+# at a time.
+FRAME_HEADER = struct.Struct("<dI")
+# Frame spools without a job row are recordings that never finished.
+ORPHAN_SPOOL_SECONDS = 300
+
+JOB_COLUMNS = (
+    "id, state, payload, attempts, available_at, lease_owner, "
+    "lease_expires_at, last_error, created_at, updated_at"
+)
+READY_JOB_SQL = (
+    "SELECT id FROM incident_jobs "
+    "WHERE (state='pending' AND available_at<=?) "
+    "OR (state='leased' AND lease_expires_at<=?) "
+    "ORDER BY available_at, created_at LIMIT 1"
+)
 
 os.makedirs(PENDING_DIR, exist_ok=True)
-os.makedirs(FAILED_DIR, exist_ok=True)
 
 _worker_started = False
 _worker_lock = threading.Lock()
+_wakeup = threading.Condition()
+_metrics_lock = threading.Lock()
+_metrics = {"in_flight": 0, "processed": 0, "retried": 0, "failed": 0}
+_worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _bump_metric(name: str, delta: int = 1) -> None:
+    with _metrics_lock:
+        _metrics[name] += delta
+
+
+def _retry_delay(retries: int) -> float:
+    delay = RETRY_BASE_SECONDS * (2 ** max(retries - 1, 0))
+    return min(delay, RETRY_MAX_SECONDS)
+
+
+def _job_to_dict(row) -> dict:
+    return {
+        "id": row[0],
+        "state": row[1],
+        "payload": json.loads(row[2]),
+        "attempts": row[3],
+        "available_at": row[4],
+        "lease_owner": row[5],
+        "lease_expires_at": row[6],
+        "last_error": row[7],
+        "created_at": row[8],
+        "updated_at": row[9],
+    }
 
 
-def _job_paths(job_id: str) -> tuple[str, str]:
-    meta_path = os.path.join(PENDING_DIR, f"{job_id}.json")
-    frames_path = os.path.join(PENDING_DIR, f"{job_id}.npz")
-    return meta_path, frames_path
-
-
-def _write_job(job_id: str, job: dict, frames: list) -> None:
-    meta_path, frames_path = _job_paths(job_id)
-    with open(meta_path, "w", encoding="utf-8") as f:
-        json.dump(job, f)
-
-    frame_array = np.stack(frames) if frames else np.empty((0,))
-    np.savez_compressed(frames_path, frames=frame_array)
-
-
-def _load_job(job_id: str) -> tuple[dict, list]:
-    meta_path, frames_path = _job_paths(job_id)
-    with open(meta_path, "r", encoding="utf-8") as f:
-        job = json.load(f)
-
-    with np.load(frames_path, allow_pickle=False) as data:
-        frames = data["frames"]
-        frame_list = [frame.copy() for frame in frames] if len(frames) else []
-
-    return job, frame_list
-
+def _frames_path(job_id: str) -> str:
+    return os.path.join(PENDING_DIR, f"{job_id}{FRAMES_EXT}")
+
+
+def _insert_job(job_id: str, payload: dict) -> None:
+    now = time.time()
+    with pool.writer() as conn:
+        conn.execute(
+            (
+                "INSERT OR IGNORE INTO incident_jobs "
+                "(id, state, payload, attempts, available_at, "
+                "created_at, updated_at) "
+                "VALUES (?, 'pending', ?, 0, ?, ?, ?)"
+            ),
+            (
+                job_id,
+                json.dumps(payload),
+                now,
+                payload.get("created_at", now),
+                now,
+            ),
+        )
+    with _wakeup:
+        _wakeup.notify()
+
+
+def _claim_job(worker_id: str) -> dict | None:
+    now = time.time()
+    # Idle workers only ever run this read, so polling an empty queue never
+    # competes with incident writes for the write lock.
+    with pool.reader() as conn:
+        if not conn.execute(READY_JOB_SQL, (now, now)).fetchone():
+            return None
+    # The pooled writer opens with BEGIN IMMEDIATE, which serializes claims
+    # across threads and processes. The probe is repeated inside it since
+    # another worker may have claimed the job in between.
+    with pool.writer() as conn:
+        row = conn.execute(READY_JOB_SQL, (now, now)).fetchone()
+        if not row:
+            return None
+        conn.execute(
+            (
+                "UPDATE incident_jobs SET state='leased', lease_owner=?, "
+                "lease_expires_at=?, attempts=attempts+1, updated_at=? "
+                "WHERE id=?"
+            ),
+            (worker_id, now + JOB_LEASE_SECONDS, now, row[0]),
+        )
+        job = conn.execute(
+            f"SELECT {JOB_COLUMNS} FROM incident_jobs WHERE id=?",
+            (row[0],),
+        ).fetchone()
+    return _job_to_dict(job)
+
+
+def _renew_lease(job_id: str, worker_id: str) -> bool:
+    now = time.time()
+    with pool.writer() as conn:
+        cursor = conn.execute(
+            (
+                "UPDATE incident_jobs SET lease_expires_at=?, updated_at=? "
+                "WHERE id=? AND lease_owner=? AND state='leased'"
+            ),
+            (now + JOB_LEASE_SECONDS, now, job_id, worker_id),
+        )
+    return bool(cursor.rowcount)
+
+
+def _heartbeat(job_id: str, worker_id: str, done: threading.Event) -> None:
+    while not done.wait(JOB_HEARTBEAT_SECONDS):
+        try:
+            if not _renew_lease(job_id, worker_id):
+                print(f"Incident job {job_id} lease was lost")
+                return
+        except sqlite3.Error as exc:
+            print(f"Failed to renew incident job lease: {exc}")
+
+
+def _complete_job(job_id: str, worker_id: str) -> None:
+    with pool.writer() as conn:
+        cursor = conn.execute(
+            "DELETE FROM incident_jobs WHERE id=? AND lease_owner=?",
+            (job_id, worker_id),
+        )
+    if cursor.rowcount:
+        frames_path = _frames_path(job_id)
+        if os.path.exists(frames_path):
+            os.remove(frames_path)
+
+
+def _fail_job(job: dict, worker_id: str, reason: str) -> str:
+    now = time.time()
+    dead = job["attempts"] >= MAX_RETRIES
+    with pool.writer() as conn:
+        conn.execute(
+            (
+                "UPDATE incident_jobs SET state=?, available_at=?, "
+                "lease_owner=NULL, lease_expires_at=NULL, last_error=?, "
+                "updated_at=? WHERE id=? AND lease_owner=?"
+            ),
+            (
+                "dead" if dead else "pending",
+                now + (0 if dead else _retry_delay(job["attempts"])),
+                reason,
+                now,
+                job["id"],
+                worker_id,
+            ),
+        )
+    return "dead" if dead else "pending"
+
+
+def list_failed_jobs(limit: int = 100) -> list[dict]:
+    with pool.reader() as conn:
+        rows = conn.execute(
+            (
+                f"SELECT {JOB_COLUMNS} FROM incident_jobs "
+                "WHERE state='dead' ORDER BY updated_at DESC LIMIT ?"
+            ),
+            (limit,),
+        ).fetchall()
+    return [_job_to_dict(row) for row in rows]
+
+
+def retry_failed_job(job_id: str) -> bool:
+    now = time.time()
+    with pool.writer() as conn:
+        cursor = conn.execute(
+            (
+                "UPDATE incident_jobs SET state='pending', attempts=0, "
+                "available_at=?, last_error=NULL, updated_at=? "
+                "WHERE id=? AND state='dead'"
+            ),
+            (now, now, job_id),
+        )
+    if not cursor.rowcount:
+        return False
+    with _wakeup:
+        _wakeup.notify()
+    return True
+
+
+def get_incident_queue_stats() -> dict:
+    now = time.time()
+    with pool.reader() as conn:
+        rows = conn.execute(
+            (
+                "SELECT state, COUNT(*), MIN(created_at), "
+                "SUM(CASE WHEN available_at<=? THEN 1 ELSE 0 END) "
+                "FROM incident_jobs GROUP BY state"
+            ),
+            (now,),
+        ).fetchall()
+    by_state = {row[0]: row for row in rows}
+    pending = by_state.get("pending")
+    oldest = min(
+        (row[2] for row in rows if row[0] in {"pending", "leased"}),
+        default=None,
+    )
+    with _metrics_lock:
+        metrics = dict(_metrics)
+    return {
+        "workers": INCIDENT_WORKERS,
+        "depth": pending[1] if pending else 0,
+        "ready": pending[3] if pending else 0,
+        "leased": by_state["leased"][1] if "leased" in by_state else 0,
+        "dead": by_state["dead"][1] if "dead" in by_state else 0,
+        "oldest_age_seconds": (
+            round(now - oldest, 3) if oldest is not None else None
+        ),
+        **metrics,
+    }
 
-def _mark_failed(job_id: str, job: dict, reason: str) -> None:
-    src_meta, src_frames = _job_paths(job_id)
-    failed_meta = os.path.join(FAILED_DIR, f"{job_id}.json")
-    failed_frames = os.path.join(FAILED_DIR, f"{job_id}.npz")
-    job["failed_reason"] = reason
-    with open(failed_meta, "w", encoding="utf-8") as f:
-        json.dump(job, f)
-    if os.path.exists(src_frames):
-        os.replace(src_frames, failed_frames)
-    if os.path.exists(src_meta):
-        os.remove(src_meta)
 
+class IncidentJobWriter:
+    # Spools JPEG frames to disk as they are recorded. The job only becomes
+    # visible to workers once finish() inserts its row.
+    def __init__(
+        self,
+        model_type: str,
+        persistence_threshold: int,
+        camera_id: int | None,
+    ):
+        self.job_id = f"{int(time.time() * 1000)}_{uuid.uuid4().hex[:8]}"
+        self.job = {
+            "model_type": model_type,
+            "confidence": None,
+            "persistence_threshold": persistence_threshold,
+            "camera_id": camera_id,
+            "event_frame_index": 0,
+            "frame_count": 0,
+            "created_at": time.time(),
+        }
+        self._frames_path = _frames_path(self.job_id)
+        self._file = open(self._frames_path, "wb")
+
+    @property
+    def frame_count(self) -> int:
+        return self.job["frame_count"]
+
+    def append(self, jpeg_bytes: bytes, captured_at: float = 0.0) -> None:
+        self._file.write(FRAME_HEADER.pack(captured_at, len(jpeg_bytes)))
+        self._file.write(jpeg_bytes)
+        self.job["frame_count"] += 1
+
+    def mark_event(self) -> None:
+        self.job["event_frame_index"] = max(self.frame_count - 1, 0)
+
+    def finish(self, confidence: float | None = None) -> bool:
+        self._file.close()
+        if not self.frame_count:
+            self.abort()
+            return False
+        self.job["confidence"] = confidence
+        _insert_job(self.job_id, self.job)
+        return True
 
-def _remove_job(job_id: str) -> None:
-    meta_path, frames_path = _job_paths(job_id)
-    if os.path.exists(meta_path):
+    def abort(self) -> None:
+        if not self._file.closed:
+            self._file.close()
+        if os.path.exists(self._frames_path):
+            os.remove(self._frames_path)
+
+
+def _iter_job_frames(job_id: str):
+    # Reads one encoded frame at a time so a whole clip is never held in
+    # memory.
+    with open(_frames_path(job_id), "rb") as f:
+        while True:
+            header = f.read(FRAME_HEADER.size)
+            if len(header) < FRAME_HEADER.size:
+                return
+            captured_at, length = FRAME_HEADER.unpack(header)
+            data = f.read(length)
+            if len(data) < length:
+                return
+            yield captured_at, data
+
+
+def _import_legacy_jobs() -> None:
+    # Jobs spooled before the job table existed have a JSON metadata file
+    # next to their frames.
+    for name in sorted(os.listdir(PENDING_DIR)):
+        if not name.endswith(".json"):
+            continue
+        job_id = name[:-5]
+        meta_path = os.path.join(PENDING_DIR, name)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                job = json.load(f)
+            if os.path.exists(_frames_path(job_id)):
+                job.pop("id", None)
+                job.pop("retries", None)
+                _insert_job(job_id, job)
+        except (OSError, ValueError) as exc:
+            print(f"Skipping unreadable incident job {job_id}: {exc}")
+            continue
         os.remove(meta_path)
-    if os.path.exists(frames_path):
-        os.remove(frames_path)
 
 
-def _list_pending_job_ids() -> list[str]:
-    ids = []
+def _remove_orphan_spools() -> None:
+    with pool.reader() as conn:
+        known = {
+            row[0] for row in conn.execute("SELECT id FROM incident_jobs")
+        }
+    now = time.time()
     for name in os.listdir(PENDING_DIR):
-        if name.endswith(".json"):
-            ids.append(name[:-5])
-    ids.sort()
-    return ids
-
-
-def _process_incident_job(job: dict, frames: list) -> None:
+        if not name.endswith(FRAMES_EXT):
+            continue
+        if name[: -len(FRAMES_EXT)] in known:
+            continue
+        frames_path = os.path.join(PENDING_DIR, name)
+        try:
+            if now - os.path.getmtime(frames_path) > ORPHAN_SPOOL_SECONDS:
+                os.remove(frames_path)
+        except OSError:
+            continue
+
+
+def _process_incident_job(job_id: str, job: dict) -> None:
     model_type = job["model_type"]
     camera_id = job.get("camera_id")
     confidence = job.get("confidence")
     persistence_threshold = job.get("persistence_threshold", 5)
+    event_frame_index = int(job.get("event_frame_index", 0))
+
+    event_jpeg = None
 
-    clip_path = save_incident_clip(frames, model_type)
-    snapshot_path = save_incident_snapshot(
-        frames[0] if frames else None,
+    def frames():
+        nonlocal event_jpeg
+        for index, (captured_at, data) in enumerate(
+            _iter_job_frames(job_id)
+        ):
+            if index <= event_frame_index:
+                event_jpeg = data
+            yield captured_at, data
+
+    clip_path = save_incident_clip(
+        frames(),
         model_type,
+        job_id,
+        settings=get_camera_config(camera_id).get("clip"),
     )
+    event_frame = None
+    if event_jpeg is not None:
+        event_frame = cv2.imdecode(
+            np.frombuffer(event_jpeg, dtype=np.uint8), cv2.IMREAD_COLOR
+        )
+    snapshot_path = save_incident_snapshot(event_frame, model_type, job_id)
 
     description = (
         f"{model_type} anomaly detected and persisted for "
         f"{persistence_threshold}s."
     )
 
+    # Keyed on the job, so a job run twice still yields one incident.
     incident = create_incident(
         incident_type=model_type,
         description=description,
@@ -110,41 +416,63 @@ def _process_incident_job(job: dict, frames: list) -> None:
             os.path.basename(snapshot_path) if snapshot_path else None
         ),
         camera_id=camera_id,
+        job_id=job_id,
     )
+    # Rendered from the incident as inserted, outside the write lock. A
+    # retried job only renders it if the first run died before doing so.
+    report_path = os.path.join(REPORTS_DIR, incident["report_path"])
+    if not os.path.isfile(report_path):
+        generate_incident_report(incident, incident["report_path"])
 
     try:
-        asyncio.run(broadcast_incident(incident))
+        publish_incident(incident)
     except Exception as exc:  # noqa: BLE001
         print(f"Failed to broadcast incident update: {exc}")
 
 
-def _worker_loop() -> None:
+def _run_job(job: dict, worker_id: str) -> None:
+    done = threading.Event()
+    threading.Thread(
+        target=_heartbeat,
+        args=(job["id"], worker_id, done),
+        name=f"incident-lease-{job['id']}",
+        daemon=True,
+    ).start()
+    try:
+        _process_incident_job(job["id"], job["payload"])
+        _complete_job(job["id"], worker_id)
+        _bump_metric("processed")
+    except Exception as exc:  # noqa: BLE001
+        state = _fail_job(job, worker_id, str(exc))
+        if state == "dead":
+            _bump_metric("failed")
+            print(f"Incident job {job['id']} failed permanently: {exc}")
+            return
+        _bump_metric("retried")
+        print(
+            f"Incident job retry {job['attempts']}/{MAX_RETRIES} "
+            f"in {_retry_delay(job['attempts']):.0f}s: {exc}"
+        )
+    finally:
+        done.set()
+
+
+def _worker_loop(worker_id: str) -> None:
     while True:
-        processed = False
-        for job_id in _list_pending_job_ids():
-            processed = True
-            try:
-                job, frames = _load_job(job_id)
-                _process_incident_job(job, frames)
-                _remove_job(job_id)
-            except Exception as exc:  # noqa: BLE001
-                try:
-                    job, _ = _load_job(job_id)
-                except Exception:  # noqa: BLE001
-                    _remove_job(job_id)
-                    continue
-                retries = int(job.get("retries", 0)) + 1
-                job["retries"] = retries
-                if retries >= MAX_RETRIES:
-                    _mark_failed(job_id, job, str(exc))
-                else:
-                    meta_path, _ = _job_paths(job_id)
-                    with open(meta_path, "w", encoding="utf-8") as f:
-                        json.dump(job, f)
-                    print(f"Incident job retry {retries}/{MAX_RETRIES}: {exc}")
-
-        if not processed:
-            time.sleep(0.5)
+        try:
+            job = _claim_job(worker_id)
+        except sqlite3.Error as exc:
+            print(f"Failed to claim incident job: {exc}")
+            job = None
+        if job is None:
+            with _wakeup:
+                _wakeup.wait(JOB_POLL_SECONDS)
+            continue
+        _bump_metric("in_flight")
+        try:
+            _run_job(job, worker_id)
+        finally:
+            _bump_metric("in_flight", -1)
 
 
 def start_incident_worker() -> None:
@@ -152,34 +480,27 @@ def start_incident_worker() -> None:
     with _worker_lock:
         if _worker_started:
             return
-        worker = threading.Thread(target=_worker_loop, daemon=True)
-        worker.start()
+        _import_legacy_jobs()
+        _remove_orphan_spools()
+        for index in range(INCIDENT_WORKERS):
+            worker = threading.Thread(
+                target=_worker_loop,
+                args=(f"{_worker_prefix}:{index}",),
+                name=f"incident-worker-{index}",
+                daemon=True,
+            )
+            worker.start()
         _worker_started = True
 
 
-def enqueue_incident_job(
+def begin_incident_job(
     model_type: str,
-    frames: list,
-    confidence: float | None,
     persistence_threshold: int,
     camera_id: int | None,
-) -> bool:
-    if not frames:
-        return False
-
+) -> IncidentJobWriter | None:
     start_incident_worker()
-    job_id = f"{int(time.time() * 1000)}_{uuid.uuid4().hex[:8]}"
-    job = {
-        "id": job_id,
-        "model_type": model_type,
-        "confidence": confidence,
-        "persistence_threshold": persistence_threshold,
-        "camera_id": camera_id,
-        "retries": 0,
-    }
     try:
-        _write_job(job_id, job, frames)
-        return True
+        return IncidentJobWriter(model_type, persistence_threshold, camera_id)
     except Exception as exc:  # noqa: BLE001
-        print(f"Failed to persist incident job: {exc}")
-        return False
+        print(f"Failed to create incident job spool: {exc}")
+        return None
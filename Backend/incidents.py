@@ -1,12 +1,53 @@
-from fastapi import APIRouter, Body, Depends, HTTPException
+from fastapi import (
+    APIRouter,
+    Body,
+    Depends,
+    HTTPException,
+    Request,
+    Response,
+)
 from pydantic import BaseModel
-from typing import List
 from datetime import datetime
-import sqlite3
-from database import get_db
-from realtime import broadcast_incident
-import asyncio
-from incident_service import create_incident
+import json
+from database import (
+    execute,
+    fetch_all,
+    read_db,
+    run_read,
+    run_write,
+    write_db,
+)
+from realtime import publish_incident, publish_incidents_bulk
+from incident_service import (
+    CHANGE_SEQ_SQL,
+    INCIDENT_FIELDS,
+    UPDATED_AT_SQL,
+    VALID_STATUSES,
+    bump_change_seq,
+    create_incident,
+    decode_cursor,
+    encode_cursor,
+    incident_changes,
+    incident_filters,
+    parse_utc_timestamp,
+    search_incidents,
+    time_range_filters,
+)
+from incident_rollups import (
+    BUCKET_FORMATS,
+    ROLLUP_DIMENSIONS,
+    ROLLUP_FIELDS,
+    query_stats,
+    record_deletions,
+    record_status_changes,
+)
+from http_cache import cached_list, list_cache_headers, not_modified
+from incident_worker import (
+    get_incident_queue_stats,
+    list_failed_jobs,
+    retry_failed_job,
+)
+from auth import get_current_user
 
 router = APIRouter()
 
@@ -21,6 +62,29 @@ class IncidentCreate(BaseModel):
     camera_id: int | None = None
 
 
+class IncidentFilter(BaseModel):
+    status: str | None = None
+    type: str | None = None
+    camera_id: int | None = None
+    event_id: int | None = None
+    created_from: str | None = None
+    created_to: str | None = None
+
+
+class IncidentSelection(BaseModel):
+    # Bulk targets: explicit ids, a filter, or both (combined with AND).
+    ids: list[int] | None = None
+    filter: IncidentFilter | None = None
+
+
+class BulkStatusUpdate(IncidentSelection):
+    status: str
+
+
+class BulkFeedback(IncidentSelection):
+    comment: str
+
+
 class IncidentOut(BaseModel):
     id: int
     type: str
@@ -34,14 +98,29 @@ class IncidentOut(BaseModel):
     report_path: str | None = None
     camera_id: int | None = None
     event_id: int | None = None
+    updated_at: str | None = None
+
+
+DELTA_PAGE_SIZE = 500
+SEARCH_PAGE_SIZE = 20
+MAX_SEARCH_PAGE_SIZE = 100
+MAX_BULK_INCIDENTS = 5000
+LIST_PAGE_SIZE = 100
+MAX_LIST_PAGE_SIZE = 1000
+
+
+def _parse_timestamp(value: str, name: str) -> datetime:
+    try:
+        return parse_utc_timestamp(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {name} value")
 
 
 @router.post("/incidents/", response_model=IncidentOut)
-def add_incident(
-    incident: IncidentCreate, db: sqlite3.Connection = Depends(get_db)
-):
+async def add_incident(incident: IncidentCreate):
     incident_obj = IncidentOut(
-        **create_incident(
+        **await run_write(
+            create_incident,
             incident_type=incident.type,
             description=incident.description,
             clip_path=incident.clip_path,
@@ -52,71 +131,227 @@ def add_incident(
         )
     )
     # Broadcast to WebSocket clients
-    asyncio.create_task(broadcast_incident(incident_obj.dict()))
+    publish_incident(incident_obj.dict())
     return incident_obj
 
 
-@router.get("/incidents/", response_model=List[IncidentOut])
-def get_incidents(
-    status: str = None,
-    type: str = None,
-    db: sqlite3.Connection = Depends(get_db),
+@router.get("/incidents/", response_model=list[IncidentOut])
+async def get_incidents(
+    request: Request,
+    status: str | None = None,
+    type: str | None = None,
+    camera_id: int | None = None,
+    event_id: int | None = None,
+    created_from: str | None = None,
+    created_to: str | None = None,
+    fields: str | None = None,
+    cursor: str | None = None,
+    limit: int = LIST_PAGE_SIZE,
 ):
-    valid_statuses = {"Open", "In Progress", "Closed"}
-    valid_types = {"ppe", "fire-smoke", "fall", "pose", "manual"}
-    if status and status not in valid_statuses:
-        raise HTTPException(status_code=400, detail="Invalid status filter")
-    if type and type not in valid_types:
-        raise HTTPException(status_code=400, detail="Invalid type filter")
-    c = db.cursor()
-    query = (
-        "SELECT id, type, description, status, created_at, clip_path, "
-        "source, confidence, evidence_image, report_path, camera_id, "
-        "event_id "
-        "FROM incidents"
-    )
-    params = []
-    filters = []
-    if status:
-        filters.append("status = ?")
-        params.append(status)
-    if type:
-        filters.append("type = ?")
-        params.append(type)
+    try:
+        filters, params = incident_filters(
+            status=status,
+            incident_type=type,
+            camera_id=camera_id,
+            event_id=event_id,
+            created_from=created_from,
+            created_to=created_to,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    selected = INCIDENT_FIELDS
+    if fields:
+        selected = tuple(
+            dict.fromkeys(f.strip() for f in fields.split(",") if f.strip())
+        )
+        unknown = set(selected) - set(INCIDENT_FIELDS)
+        if unknown or not selected:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid fields: {', '.join(sorted(unknown))}",
+            )
+    # created_at and id are always read so the next cursor can be built.
+    columns = ("created_at", "id") + selected
+
+    if cursor:
+        try:
+            cursor_created_at, cursor_id = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        # Row-value comparison lets SQLite seek the index to the cursor.
+        filters.append("(created_at, id) < (?, ?)")
+        params.extend([cursor_created_at, cursor_id])
+    limit = max(1, min(limit, MAX_LIST_PAGE_SIZE))
+
+    headers = await list_cache_headers(request, "incidents")
+    if not_modified(request, headers):
+        return Response(status_code=304, headers=headers)
+    query = f"SELECT {', '.join(columns)} FROM incidents"
     if filters:
         query += " WHERE " + " AND ".join(filters)
-    query += " ORDER BY created_at DESC"
-    c.execute(query, params)
-    return [
-        IncidentOut(
-            id=row[0],
-            type=row[1],
-            description=row[2],
-            status=row[3],
-            created_at=row[4],
-            clip_path=row[5],
-            source=row[6],
-            confidence=row[7],
-            evidence_image=row[8],
-            report_path=row[9],
-            camera_id=row[10],
-            event_id=row[11],
+    query += " ORDER BY created_at DESC, id DESC LIMIT ?"
+    params.append(limit + 1)
+    rows = await fetch_all(query, params)
+
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = encode_cursor(rows[-1][0], rows[-1][1])
+    # Rows go straight to JSON; building an IncidentOut per row dominated
+    # the response time on large tables.
+    body = json.dumps(
+        [dict(zip(selected, row[2:])) for row in rows],
+        separators=(",", ":"),
+    )
+    return Response(
+        content=body, media_type="application/json", headers=headers
+    )
+
+
+@router.get("/incidents/delta")
+async def get_incident_delta(
+    since: str | None = None,
+    updated_since: str | None = None,
+    limit: int = DELTA_PAGE_SIZE,
+):
+    # Returns incidents created or changed after the client's sync token.
+    # Without a token the scan starts from the beginning, so a client can
+    # page through the full table once and then keep up with deltas only.
+    # Tokens are (change_seq, id) positions.
+    position = None
+    updated_at = None
+    if since:
+        try:
+            value, after_id = decode_cursor(since)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid sync token")
+        # Tokens issued before change sequences carry a timestamp; those
+        # clients start over, which merging by id makes harmless.
+        position = (int(value), after_id) if value.isdigit() else (0, 0)
+    elif updated_since:
+        parsed = _parse_timestamp(updated_since, "updated_since")
+        # Stored stamps are UTC with millisecond precision; include rows
+        # updated exactly at the given instant.
+        updated_at = parsed.isoformat(timespec="milliseconds")
+    limit = max(1, min(limit, DELTA_PAGE_SIZE))
+    incidents, deleted, position = await read_db(
+        incident_changes, position, updated_at, limit
+    )
+    next_token = (
+        encode_cursor(str(position[0]), position[1])
+        if position is not None
+        else None
+    )
+    return {
+        "incidents": incidents,
+        "deleted": deleted,
+        "next_token": next_token,
+        "has_more": len(incidents) == limit,
+    }
+
+
+@router.get("/incidents/stats")
+async def get_incident_stats(
+    request: Request,
+    response: Response,
+    granularity: str = "day",
+    created_from: str | None = None,
+    created_to: str | None = None,
+    type: str | None = None,
+    camera_id: int | None = None,
+    source: str | None = None,
+    status: str | None = None,
+    group_by: str | None = None,
+):
+    # Incident counts per hour or day from the rollup tables. Buckets are
+    # UTC and keyed by creation time; group_by splits each bucket by any of
+    # type, camera_id, source and status.
+    if granularity not in BUCKET_FORMATS:
+        raise HTTPException(status_code=400, detail="Invalid granularity")
+    dimensions = ()
+    if group_by:
+        dimensions = tuple(
+            dict.fromkeys(d.strip() for d in group_by.split(",") if d.strip())
         )
-        for row in c.fetchall()
-    ]
+        unknown = set(dimensions) - set(ROLLUP_DIMENSIONS)
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid group_by: {', '.join(sorted(unknown))}",
+            )
+    try:
+        filters, params = time_range_filters(
+            "bucket",
+            created_from,
+            created_to,
+            time_format=BUCKET_FORMATS[granularity],
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    for column, value in (
+        ("type", type),
+        ("camera_id", camera_id),
+        ("source", source),
+        ("status", status),
+    ):
+        if value is not None and value != "":
+            filters.append(f"{column} = ?")
+            params.append(value)
+    # The rollups change in the same transactions as incidents.
+    cached = await cached_list(request, response, "incidents")
+    if cached is not None:
+        return cached
+    return await read_db(
+        query_stats, granularity, dimensions, filters, params
+    )
 
 
-@router.get("/incidents/events")
-def get_incident_events(db: sqlite3.Connection = Depends(get_db)):
-    c = db.cursor()
-    c.execute(
-        (
-            "SELECT id, incident_type, camera_id, state, started_at, "
-            "last_seen_at, resolved_at, incident_count "
-            "FROM incident_events ORDER BY id DESC"
+@router.get("/incidents/search")
+async def search_incident_text(
+    q: str,
+    status: str | None = None,
+    type: str | None = None,
+    camera_id: int | None = None,
+    created_from: str | None = None,
+    created_to: str | None = None,
+    limit: int = SEARCH_PAGE_SIZE,
+    offset: int = 0,
+):
+    # Full-text search over descriptions and feedback comments, best
+    # matches first. Pass next_offset back as offset for the next page.
+    try:
+        filters, params = incident_filters(
+            status=status,
+            incident_type=type,
+            camera_id=camera_id,
+            created_from=created_from,
+            created_to=created_to,
         )
+        if not q.strip():
+            raise ValueError("Search text is required")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    limit = max(1, min(limit, MAX_SEARCH_PAGE_SIZE))
+    offset = max(0, offset)
+    results = await read_db(
+        search_incidents, q, filters, params, limit + 1, offset
+    )
+    has_more = len(results) > limit
+    return {
+        "incidents": results[:limit],
+        "next_offset": offset + limit if has_more else None,
+    }
+
+
+@router.get("/incidents/events")
+async def get_incident_events(request: Request, response: Response):
+    cached = await cached_list(request, response, "incident_events")
+    if cached is not None:
+        return cached
+    rows = await fetch_all(
+        "SELECT id, incident_type, camera_id, state, started_at, "
+        "last_seen_at, resolved_at, incident_count "
+        "FROM incident_events ORDER BY id DESC"
     )
-    rows = c.fetchall()
     return [
         {
             "id": row[0],
@@ -132,19 +367,204 @@ def get_incident_events(db: sqlite3.Connection = Depends(get_db)):
     ]
 
 
-@router.patch("/incidents/{incident_id}/status")
-def update_incident_status(
-    incident_id: int, status: str, db: sqlite3.Connection = Depends(get_db)
+@router.get("/incidents/jobs/stats")
+async def get_incident_job_stats():
+    return await run_read(get_incident_queue_stats)
+
+
+@router.get("/incidents/jobs/failed")
+async def get_failed_incident_jobs(
+    limit: int = 100, current_user: dict = Depends(get_current_user)
+):
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin role required")
+    return await run_read(list_failed_jobs, limit=max(1, min(limit, 500)))
+
+
+@router.post("/incidents/jobs/{job_id}/retry")
+async def retry_incident_job(
+    job_id: str, current_user: dict = Depends(get_current_user)
 ):
-    valid_statuses = {"Open", "In Progress", "Closed"}
-    if status not in valid_statuses:
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin role required")
+    if not await run_write(retry_failed_job, job_id):
+        raise HTTPException(status_code=404, detail="Failed job not found.")
+    return {"message": "Job queued for retry.", "id": job_id}
+
+
+def _selection_filters(selection: IncidentSelection) -> tuple[list, list]:
+    filters = []
+    params = []
+    if selection.ids:
+        # One JSON parameter instead of one per id, so large selections
+        # stay under SQLite's bound-parameter limit.
+        filters.append("id IN (SELECT value FROM json_each(?))")
+        params.append(json.dumps(selection.ids))
+    if selection.filter is not None:
+        f = selection.filter
+        try:
+            range_filters, range_params = incident_filters(
+                status=f.status,
+                incident_type=f.type,
+                camera_id=f.camera_id,
+                event_id=f.event_id,
+                created_from=f.created_from,
+                created_to=f.created_to,
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        filters.extend(range_filters)
+        params.extend(range_params)
+    if not filters:
+        raise HTTPException(
+            status_code=400, detail="Provide incident ids or a filter."
+        )
+    return filters, params
+
+
+def _bulk_targets(c, filters: list, params: list) -> list[dict]:
+    c.execute(
+        (
+            f"SELECT id, {', '.join(ROLLUP_FIELDS)} FROM incidents "
+            f"WHERE {' AND '.join(filters)} ORDER BY id LIMIT ?"
+        ),
+        params + [MAX_BULK_INCIDENTS + 1],
+    )
+    rows = c.fetchall()
+    if len(rows) > MAX_BULK_INCIDENTS:
+        raise HTTPException(
+            status_code=400,
+            detail=(
+                f"Selection matches more than {MAX_BULK_INCIDENTS} "
+                "incidents; narrow it down."
+            ),
+        )
+    return [dict(zip(("id",) + ROLLUP_FIELDS, row)) for row in rows]
+
+
+def _audit_rows(ids: list[int], status: str) -> list[tuple]:
+    changed_at = datetime.utcnow().isoformat()
+    return [(incident_id, status, changed_at) for incident_id in ids]
+
+
+def _bulk_set_status(db, filters: list, params: list, status: str) -> list:
+    c = db.cursor()
+    incidents = [
+        incident
+        for incident in _bulk_targets(c, filters, params)
+        if (incident["status"] or "Open") != status
+    ]
+    ids = [incident["id"] for incident in incidents]
+    record_status_changes(c, incidents, status)
+    bump_change_seq(c)
+    c.executemany(
+        f"UPDATE incidents SET status=?, updated_at={UPDATED_AT_SQL}, "
+        f"change_seq={CHANGE_SEQ_SQL} WHERE id=?",
+        [(status, incident_id) for incident_id in ids],
+    )
+    c.executemany(
+        (
+            "INSERT INTO incident_audit (incident_id, status, changed_at) "
+            "VALUES (?, ?, ?)"
+        ),
+        _audit_rows(ids, status),
+    )
+    return ids
+
+
+def _bulk_add_feedback(db, filters: list, params: list, comment: str) -> list:
+    c = db.cursor()
+    ids = [incident["id"] for incident in _bulk_targets(c, filters, params)]
+    c.executemany(
+        "INSERT INTO feedback (incident_id, comment) VALUES (?, ?)",
+        [(incident_id, comment) for incident_id in ids],
+    )
+    return ids
+
+
+def _bulk_delete(db, filters: list, params: list) -> list:
+    # Evidence files stay on disk; the audit trail records the deletion.
+    c = db.cursor()
+    incidents = _bulk_targets(c, filters, params)
+    ids = [incident["id"] for incident in incidents]
+    record_deletions(c, incidents)
+    c.executemany(
+        "DELETE FROM feedback WHERE incident_id=?", [(i,) for i in ids]
+    )
+    c.executemany("DELETE FROM incidents WHERE id=?", [(i,) for i in ids])
+    bump_change_seq(c)
+    c.executemany(
+        (
+            "INSERT OR REPLACE INTO incident_tombstones "
+            "(incident_id, change_seq, deleted_at) "
+            f"VALUES (?, {CHANGE_SEQ_SQL}, {UPDATED_AT_SQL})"
+        ),
+        [(i,) for i in ids],
+    )
+    c.executemany(
+        (
+            "INSERT INTO incident_audit (incident_id, status, changed_at) "
+            "VALUES (?, ?, ?)"
+        ),
+        _audit_rows(ids, "Deleted"),
+    )
+    return ids
+
+
+# Registered before the /incidents/{incident_id} routes so "bulk" is never
+# taken for an incident id.
+@router.post("/incidents/bulk/status")
+async def bulk_update_status(update: BulkStatusUpdate):
+    if update.status not in VALID_STATUSES:
         raise HTTPException(status_code=400, detail="Invalid status value")
+    filters, params = _selection_filters(update)
+    ids = await write_db(_bulk_set_status, filters, params, update.status)
+    if ids:
+        publish_incidents_bulk("status", ids, status=update.status)
+    return {"updated": len(ids), "ids": ids}
+
+
+@router.post("/incidents/bulk/feedback")
+async def bulk_submit_feedback(feedback: BulkFeedback):
+    comment = (feedback.comment or "").strip()
+    if not comment:
+        raise HTTPException(status_code=400, detail="Comment is required")
+    filters, params = _selection_filters(feedback)
+    ids = await write_db(_bulk_add_feedback, filters, params, comment)
+    if ids:
+        publish_incidents_bulk("feedback", ids)
+    return {"updated": len(ids), "ids": ids}
+
+
+@router.post("/incidents/bulk/delete")
+async def bulk_delete_incidents(
+    selection: IncidentSelection,
+    current_user: dict = Depends(get_current_user),
+):
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin role required")
+    filters, params = _selection_filters(selection)
+    ids = await write_db(_bulk_delete, filters, params)
+    if ids:
+        publish_incidents_bulk("delete", ids)
+    return {"deleted": len(ids), "ids": ids}
+
+
+def _set_incident_status(db, incident_id: int, status: str) -> None:
     c = db.cursor()
-    c.execute("SELECT id FROM incidents WHERE id=?", (incident_id,))
-    if not c.fetchone():
+    c.execute(
+        f"SELECT {', '.join(ROLLUP_FIELDS)} FROM incidents WHERE id=?",
+        (incident_id,),
+    )
+    row = c.fetchone()
+    if not row:
         raise HTTPException(status_code=404, detail="Incident not found.")
+    record_status_changes(c, [dict(zip(ROLLUP_FIELDS, row))], status)
+    bump_change_seq(c)
     c.execute(
-        "UPDATE incidents SET status=? WHERE id=?", (status, incident_id)
+        f"UPDATE incidents SET status=?, updated_at={UPDATED_AT_SQL}, "
+        f"change_seq={CHANGE_SEQ_SQL} WHERE id=?",
+        (status, incident_id),
     )
     c.execute(
         (
@@ -153,37 +573,59 @@ def update_incident_status(
         ),
         (incident_id, status, datetime.utcnow().isoformat()),
     )
-    db.commit()
+
+
+@router.patch("/incidents/{incident_id}/status")
+async def update_incident_status(incident_id: int, status: str):
+    if status not in VALID_STATUSES:
+        raise HTTPException(status_code=400, detail="Invalid status value")
+    await write_db(_set_incident_status, incident_id, status)
     return {"message": "Status updated."}
 
 
 @router.get("/incidents/audit/{incident_id}")
-def get_incident_audit(
-    incident_id: int, db: sqlite3.Connection = Depends(get_db)
+async def get_incident_audit(
+    incident_id: int, request: Request, response: Response
 ):
-    c = db.cursor()
-    c.execute(
+    cached = await cached_list(request, response, "incident_audit")
+    if cached is not None:
+        return cached
+    rows = await fetch_all(
         (
             "SELECT status, changed_at FROM incident_audit "
             "WHERE incident_id=? ORDER BY changed_at DESC"
         ),
         (incident_id,),
     )
-    return [{"status": row[0], "changed_at": row[1]} for row in c.fetchall()]
+    return [{"status": row[0], "changed_at": row[1]} for row in rows]
 
 
-@router.post("/incidents/{incident_id}/feedback")
-def submit_feedback(
-    incident_id: int,
-    comment: str = Body(...),
-    db: sqlite3.Connection = Depends(get_db),
+@router.get("/incidents/{incident_id}/feedback")
+async def get_incident_feedback(
+    incident_id: int, request: Request, response: Response
 ):
+    cached = await cached_list(request, response, "feedback")
+    if cached is not None:
+        return cached
+    rows = await fetch_all(
+        (
+            "SELECT id, comment, created_at FROM feedback "
+            "WHERE incident_id=? ORDER BY id"
+        ),
+        (incident_id,),
+    )
+    return [
+        {"id": row[0], "comment": row[1], "created_at": row[2]}
+        for row in rows
+    ]
+
+
+@router.post("/incidents/{incident_id}/feedback")
+async def submit_feedback(incident_id: int, comment: str = Body(...)):
     if not comment or not comment.strip():
         raise HTTPException(status_code=400, detail="Comment is required")
-    c = db.cursor()
-    c.execute(
+    await execute(
         "INSERT INTO feedback (incident_id, comment) VALUES (?, ?)",
         (incident_id, comment.strip()),
     )
-    db.commit()
     return {"message": "Feedback submitted."}
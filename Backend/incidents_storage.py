@@ -1,6 +1,6 @@
 import os
 import cv2
-from datetime import datetime
+from clip_encoder import encode_clip
 
 INCIDENT_CLIPS_DIR = os.path.abspath(
     os.path.join(os.path.dirname(__file__), "../Database/incident_clips")
@@ -12,26 +12,34 @@ os.makedirs(INCIDENT_CLIPS_DIR, exist_ok=True)
 os.makedirs(INCIDENT_IMAGES_DIR, exist_ok=True)
 
 
-def save_incident_clip(frames, incident_type):
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"{incident_type}_{timestamp}.mp4"
+def _evidence_name(incident_type, job_id, ext):
+    # Named after the job rather than the current second: unique across
+    # workers, and a retried job rewrites its own file instead of leaving
+    # one behind.
+    return f"{incident_type}_{job_id}{ext}"
+
+
+def save_incident_clip(encoded_frames, incident_type, job_id, settings=None):
+    # encoded_frames yields (capture timestamp, JPEG bytes) pairs, streamed
+    # from the job spool; settings holds the camera's clip options.
+    filename = _evidence_name(incident_type, job_id, ".mp4")
     filepath = os.path.join(INCIDENT_CLIPS_DIR, filename)
-    if not frames:
-        return None
-    height, width, _ = frames[0].shape
-    fourcc = cv2.VideoWriter_fourcc(*"mp4v")
-    out = cv2.VideoWriter(filepath, fourcc, 20.0, (width, height))
-    for frame in frames:
-        out.write(frame)
-    out.release()
+    try:
+        if not encode_clip(encoded_frames, filepath, settings):
+            if os.path.exists(filepath):
+                os.remove(filepath)
+            return None
+    except Exception:
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        raise
     return filepath
 
 
-def save_incident_snapshot(frame, incident_type):
+def save_incident_snapshot(frame, incident_type, job_id):
     if frame is None:
         return None
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"{incident_type}_{timestamp}.jpg"
+    filename = _evidence_name(incident_type, job_id, ".jpg")
     filepath = os.path.join(INCIDENT_IMAGES_DIR, filename)
     ok = cv2.imwrite(filepath, frame)
     return filepath if ok else None
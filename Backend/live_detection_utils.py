@@ -1,6 +1,11 @@
 import cv2
 import time
-from camera_stream import ensure_camera_started, get_camera_index, get_frame
+from camera_stream import (
+    ensure_camera_started,
+    get_camera_index,
+    get_frame_after,
+)
+from cameras import get_camera_config
 from live_session import (
     activate_model,
     deactivate_models,
@@ -12,7 +17,64 @@ from ppe_model import detect_ppe
 from fire_smoke_model import detect_fire_smoke
 from fall_model import detect_fall
 from pose_model import detect_pose
-from incident_worker import enqueue_incident_job
+from incident_worker import begin_incident_job
+from clip_buffer import DEFAULT_PREROLL_SECONDS, get_clip_buffer
+from frame_scheduler import (
+    DEFAULT_CAMERA_PRIORITY,
+    DEFAULT_FRAME_DEADLINE_MS,
+    get_frame_scheduler,
+)
+from load_controller import DEFAULT_LATENCY_TARGET_MS, get_load_controller
+
+
+def _run_detection(model_type, frame, tiling=None, imgsz=640):
+    if model_type == "ppe":
+        detections = detect_ppe(frame, tiling=tiling, imgsz=imgsz)
+        anomaly = any("NO-" in det.get("label", "") for det in detections)
+    elif model_type == "fire-smoke":
+        detections = detect_fire_smoke(frame, tiling=tiling, imgsz=imgsz)
+        anomaly = any(
+            det.get("label", "").lower() in {"fire", "smoke"}
+            for det in detections
+        )
+    elif model_type == "fall":
+        detections = detect_fall(frame, imgsz=imgsz)
+        anomaly = any(
+            det.get("label", "").lower() in {"fall", "fallen"}
+            for det in detections
+        )
+    elif model_type == "pose":
+        try:
+            detections = detect_pose(frame, imgsz=imgsz)
+        except Exception as e:  # noqa: BLE001
+            print(f"Pose detection failed: {e}")
+            detections = []
+        anomaly = False
+    else:
+        detections = []
+        anomaly = False
+    return detections, anomaly
+
+
+def _draw_detections(frame, detections) -> None:
+    for det in detections:
+        if "bbox" in det:
+            x1, y1, x2, y2 = map(int, det["bbox"])
+            label = det.get("label", "object")
+            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+            cv2.putText(
+                frame,
+                label,
+                (x1, y1 - 10),
+                cv2.FONT_HERSHEY_SIMPLEX,
+                0.7,
+                (0, 255, 0),
+                2,
+            )
+        for point in det.get("keypoints", []):
+            if len(point) >= 2:
+                xk, yk = int(point[0]), int(point[1])
+                cv2.circle(frame, (xk, yk), 3, (0, 180, 255), -1)
 
 
 def gen_live_detection(model_type):
@@ -21,18 +83,19 @@ def gen_live_detection(model_type):
 
     session_id = activate_model(model_type)
 
-    fps = 20  # fallback FPS for clip buffering
     anomaly_start = None
-    recording = False
-    frames_buffer = []
+    clip_job = None
+    recording_started = 0.0
     incident_recorded = False
     last_incident_time = 0
     incident_cooldown = 15  # seconds to prevent duplicate incidents
-    record_duration = 10  # seconds
+    record_duration = 10  # seconds of post-event footage
     persistence_threshold = 5  # anomaly must persist for 5s
-    max_buffer = int(fps * record_duration)
     inactive_stream = False
     last_confidence = None
+    last_detections = []
+    last_anomaly = False
+    last_seq = 0
     try:
         while True:
             # Sleep previous model streams when a new model is activated.
@@ -41,9 +104,10 @@ def gen_live_detection(model_type):
                     sleep_model(model_type)
                     inactive_stream = True
 
-                frame = get_frame(timeout_seconds=1.0)
-                if frame is None:
+                captured = get_frame_after(last_seq, timeout_seconds=1.0)
+                if captured is None:
                     continue
+                frame, _, last_seq = captured
 
                 encoded, buffer = cv2.imencode(".jpg", frame)
                 if not encoded:
@@ -58,116 +122,155 @@ def gen_live_detection(model_type):
 
             inactive_stream = False
 
-            frame = get_frame(timeout_seconds=1.0)
-            if frame is None:
+            captured = get_frame_after(last_seq, timeout_seconds=1.0)
+            if captured is None:
                 continue
+            frame, captured_at, last_seq = captured
 
-            if model_type == "ppe":
-                detections = detect_ppe(frame)
-                anomaly = any(
-                    "NO-" in det.get("label", "") for det in detections
-                )
-            elif model_type == "fire-smoke":
-                detections = detect_fire_smoke(frame)
-                anomaly = any(
-                    det.get("label", "").lower() in {"fire", "smoke"}
-                    for det in detections
-                )
-            elif model_type == "fall":
-                detections = detect_fall(frame)
-                anomaly = any(
-                    det.get("label", "").lower() in {"fall", "fallen"}
-                    for det in detections
-                )
-            elif model_type == "pose":
+            frame_started = time.perf_counter()
+            camera_id = get_camera_index()
+            camera_config = get_camera_config(camera_id)
+            scheduler = get_frame_scheduler(
+                camera_id,
+                camera_config.get(
+                    "frame_deadline_ms", DEFAULT_FRAME_DEADLINE_MS
+                ),
+                camera_config.get("priority", DEFAULT_CAMERA_PRIORITY),
+            )
+            load = get_load_controller(
+                camera_id,
+                camera_config.get(
+                    "latency_target_ms", DEFAULT_LATENCY_TARGET_MS
+                ),
+            )
+            level = load.settings()
+            clip_buffer = get_clip_buffer(
+                camera_id,
+                camera_config.get("preroll_seconds", DEFAULT_PREROLL_SECONDS),
+            )
+
+            # Under load only every Nth frame runs inference; the frames in
+            # between reuse the last result so the stream keeps up.
+            if load.should_infer():
+                if not scheduler.admit(captured_at):
+                    continue
                 try:
-                    detections = detect_pose(frame)
-                except Exception as e:  # noqa: BLE001
-                    print(f"Pose detection failed: {e}")
-                    detections = []
-                anomaly = False
+                    detections, anomaly = _run_detection(
+                        model_type,
+                        frame,
+                        tiling=(
+                            camera_config.get("tiling")
+                            if level["tiling"]
+                            else None
+                        ),
+                        imgsz=level["imgsz"],
+                    )
+                finally:
+                    scheduler.release()
+                last_detections, last_anomaly = detections, anomaly
+
+                if detections:
+                    confs = [
+                        float(det.get("confidence", 0.0))
+                        for det in detections
+                        if det.get("confidence") is not None
+                    ]
+                    if confs:
+                        last_confidence = max(confs)
             else:
-                detections = []
-                anomaly = False
-
-            if detections:
-                confs = [
-                    float(det.get("confidence", 0.0))
-                    for det in detections
-                    if det.get("confidence") is not None
-                ]
-                if confs:
-                    last_confidence = max(confs)
+                detections, anomaly = last_detections, last_anomaly
 
             # Draw detections for all model types.
-            for det in detections:
-                if "bbox" in det:
-                    x1, y1, x2, y2 = map(int, det["bbox"])
-                    label = det.get("label", "object")
-                    cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                    cv2.putText(
-                        frame,
-                        label,
-                        (x1, y1 - 10),
-                        cv2.FONT_HERSHEY_SIMPLEX,
-                        0.7,
-                        (0, 255, 0),
-                        2,
-                    )
-                for point in det.get("keypoints", []):
-                    if len(point) >= 2:
-                        xk, yk = int(point[0]), int(point[1])
-                        cv2.circle(frame, (xk, yk), 3, (0, 180, 255), -1)
+            _draw_detections(frame, detections)
+
+            # Encode once; the same JPEG feeds the stream, the pre-roll
+            # buffer and any incident clip being recorded. Stale frames
+            # were already dropped before inference.
+            scheduler.record_finish(captured_at)
+            frame_bytes = None
+            encoded, buffer = cv2.imencode(
+                ".jpg",
+                frame,
+                [cv2.IMWRITE_JPEG_QUALITY, level["jpeg_quality"]],
+            )
+            if encoded:
+                frame_bytes = buffer.tobytes()
+                clip_buffer.append(captured_at, frame_bytes)
+            load.record(time.perf_counter() - frame_started)
+
             now = time.time()
+            if clip_job is not None and frame_bytes is not None:
+                try:
+                    clip_job.append(frame_bytes, captured_at)
+                except OSError as e:
+                    print(f"Failed to spool incident frame: {e}")
+                    clip_job.abort()
+                    clip_job = None
+
             if anomaly:
                 if anomaly_start is None:
                     anomaly_start = now
                 elif (
-                    not recording
+                    clip_job is None
                     and (now - anomaly_start > persistence_threshold)
                     and not incident_recorded
                     and (now - last_incident_time > incident_cooldown)
                 ):
-                    # Start recording
-                    recording = True
-                    frames_buffer = []
+                    # Start recording with the pre-roll leading up to now;
+                    # frames are spooled to disk as they arrive.
+                    clip_job = begin_incident_job(
+                        model_type=model_type,
+                        persistence_threshold=persistence_threshold,
+                        camera_id=camera_id,
+                    )
+                    if clip_job is None:
+                        print(
+                            "Failed to enqueue incident job. "
+                            "Skipping this incident."
+                        )
+                        incident_recorded = True
+                    else:
+                        recording_started = now
+                        for frame_at, data in clip_buffer.snapshot():
+                            clip_job.append(data, frame_at)
+                        clip_job.mark_event()
             else:
                 anomaly_start = None
-                recording = False
-                frames_buffer = []
+                if clip_job is not None:
+                    clip_job.abort()
+                    clip_job = None
                 incident_recorded = False
 
-            if recording:
-                frames_buffer.append(frame.copy())
-                if len(frames_buffer) >= max_buffer:
-                    enqueued = enqueue_incident_job(
-                        model_type=model_type,
-                        frames=frames_buffer.copy(),
-                        confidence=last_confidence,
-                        persistence_threshold=persistence_threshold,
-                        camera_id=get_camera_index(),
-                    )
-                    try:
-                        if not enqueued:
-                            print(
-                                "Failed to enqueue incident job. "
-                                "Skipping this incident."
-                            )
-                    except Exception as e:
-                        print(f"Failed to enqueue incident: {e}")
-                    last_incident_time = now
-                    incident_recorded = True
-                    recording = False
-                    frames_buffer = []
-
-            _, buffer = cv2.imencode(".jpg", frame)
-            frame_bytes = buffer.tobytes()
+            if (
+                clip_job is not None
+                and now - recording_started >= record_duration
+            ):
+                try:
+                    if not clip_job.finish(confidence=last_confidence):
+                        print(
+                            "Failed to enqueue incident job. "
+                            "Skipping this incident."
+                        )
+                except Exception as e:
+                    print(f"Failed to enqueue incident: {e}")
+                last_incident_time = now
+                incident_recorded = True
+                clip_job = None
+
+            if frame_bytes is None:
+                continue
+
+            scheduler.mark_processed()
             yield (
                 b"--frame\r\nContent-Type: image/jpeg\r\n\r\n"
                 + frame_bytes
                 + b"\r\n"
             )
     finally:
+        # A recording cut short by the stream closing is discarded, the
+        # same as when the anomaly clears before the clip is complete.
+        if clip_job is not None:
+            clip_job.abort()
         # If this was still the active session, monitoring has ended.
         if is_active(model_type, session_id):
             deactivate_models()
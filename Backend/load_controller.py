@@ -0,0 +1,121 @@
+import threading
+import time
+
+
+# Ordered from best quality to cheapest. Tiled inference is only kept at
+# the top level because it multiplies inference cost by the tile count.
+LOAD_LEVELS = [
+    {"imgsz": 640, "stride": 1, "jpeg_quality": 85, "tiling": True},
+    {"imgsz": 640, "stride": 1, "jpeg_quality": 75, "tiling": False},
+    {"imgsz": 512, "stride": 2, "jpeg_quality": 70, "tiling": False},
+    {"imgsz": 416, "stride": 3, "jpeg_quality": 60, "tiling": False},
+    {"imgsz": 320, "stride": 4, "jpeg_quality": 50, "tiling": False},
+]
+DEFAULT_LATENCY_TARGET_MS = 200.0
+EWMA_ALPHA = 0.2
+# Step back up only when the average cost is well under the target.
+HEADROOM_RATIO = 0.6
+DOWNGRADE_HOLD_SECONDS = 2.0
+UPGRADE_HOLD_SECONDS = 10.0
+
+
+class LoadController:
+    def __init__(
+        self,
+        camera_id: int | None,
+        latency_target_ms: float = DEFAULT_LATENCY_TARGET_MS,
+    ):
+        self.camera_id = camera_id
+        self.latency_target_ms = float(latency_target_ms)
+        self.level = 0
+        self.avg_frame_ms: float | None = None
+        self._frame_counter = 0
+        self._last_change = time.monotonic()
+        self._lock = threading.Lock()
+
+    def settings(self) -> dict:
+        with self._lock:
+            return dict(LOAD_LEVELS[self.level])
+
+    def should_infer(self) -> bool:
+        with self._lock:
+            stride = LOAD_LEVELS[self.level]["stride"]
+            run = self._frame_counter % stride == 0
+            self._frame_counter += 1
+            return run
+
+    def record(self, frame_seconds: float) -> None:
+        frame_ms = frame_seconds * 1000.0
+        with self._lock:
+            if self.avg_frame_ms is None:
+                self.avg_frame_ms = frame_ms
+            else:
+                self.avg_frame_ms += EWMA_ALPHA * (
+                    frame_ms - self.avg_frame_ms
+                )
+            self._adjust_unlocked()
+
+    def _adjust_unlocked(self) -> None:
+        now = time.monotonic()
+        held = now - self._last_change
+        target = self.latency_target_ms
+        if (
+            self.avg_frame_ms > target
+            and self.level < len(LOAD_LEVELS) - 1
+            and held >= DOWNGRADE_HOLD_SECONDS
+        ):
+            self._set_level_unlocked(self.level + 1, now)
+        elif (
+            self.avg_frame_ms < target * HEADROOM_RATIO
+            and self.level > 0
+            and held >= UPGRADE_HOLD_SECONDS
+        ):
+            self._set_level_unlocked(self.level - 1, now)
+
+    def _set_level_unlocked(self, level: int, now: float) -> None:
+        self.level = level
+        self._last_change = now
+        self._frame_counter = 0
+
+    def set_latency_target(self, latency_target_ms: float) -> None:
+        with self._lock:
+            self.latency_target_ms = float(latency_target_ms)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "camera_id": self.camera_id,
+                "level": self.level,
+                "max_level": len(LOAD_LEVELS) - 1,
+                "latency_target_ms": self.latency_target_ms,
+                "avg_frame_ms": (
+                    round(self.avg_frame_ms, 2)
+                    if self.avg_frame_ms is not None
+                    else None
+                ),
+                **LOAD_LEVELS[self.level],
+            }
+
+
+_controllers: dict[int | None, LoadController] = {}
+_controllers_lock = threading.Lock()
+
+
+def get_load_controller(
+    camera_id: int | None,
+    latency_target_ms: float = DEFAULT_LATENCY_TARGET_MS,
+) -> LoadController:
+    with _controllers_lock:
+        controller = _controllers.get(camera_id)
+        if controller is None:
+            controller = LoadController(camera_id, latency_target_ms)
+            _controllers[camera_id] = controller
+        elif controller.latency_target_ms != float(latency_target_ms):
+            controller.set_latency_target(latency_target_ms)
+        return controller
+
+
+def get_load_levels() -> list[dict]:
+    with _controllers_lock:
+        controllers = list(_controllers.values())
+    return [controller.snapshot() for controller in controllers]
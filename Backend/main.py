@@ -1,8 +1,6 @@
-from fastapi import FastAPI, Depends, HTTPException, Header, Query
+from fastapi import FastAPI, Depends, HTTPException, Header, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
 import os
-import sqlite3
 from dotenv import load_dotenv
 from database import init_db
 from people import router as people_router
@@ -14,9 +12,10 @@ from realtime import router as realtime_router
 from settings import router as settings_router
 from cameras import router as cameras_router
 from report import router as report_router
-from auth import decode_access_token, get_current_user
-from database import DB_PATH
+from auth import decode_access_token, get_current_user, get_user
 from incident_worker import start_incident_worker
+from incident_events import start_event_flusher
+from http_cache import evidence_file_response
 
 load_dotenv(os.path.join(os.path.dirname(__file__), ".env"))
 
@@ -35,6 +34,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PATCH", "PUT", "DELETE", "OPTIONS"],
     allow_headers=["Authorization", "Content-Type"],
+    expose_headers=[
+        "X-Next-Cursor",
+        "ETag",
+        "Last-Modified",
+        "Accept-Ranges",
+        "Content-Range",
+    ],
 )
 # Incident clip directory
 CLIPS_DIR = os.path.abspath(
@@ -59,16 +65,14 @@ def _validate_user_token(authorization: str | None, token: str | None):
     if not payload:
         raise HTTPException(status_code=401, detail="Unauthorized")
 
-    with sqlite3.connect(DB_PATH) as conn:
-        c = conn.cursor()
-        c.execute("SELECT id FROM users WHERE id=?", (payload.get("id"),))
-        if not c.fetchone():
-            raise HTTPException(status_code=401, detail="User not found")
+    if not get_user(payload.get("id")):
+        raise HTTPException(status_code=401, detail="User not found")
 
 
 @app.get("/clips/{clip_name}")
 def get_clip(
     clip_name: str,
+    request: Request,
     authorization: str | None = Header(default=None),
     token: str | None = Query(default=None),
 ):
@@ -80,12 +84,13 @@ def get_clip(
     file_path = os.path.join(CLIPS_DIR, safe_name)
     if not os.path.isfile(file_path):
         raise HTTPException(status_code=404, detail="Clip not found")
-    return FileResponse(file_path, media_type="video/mp4")
+    return evidence_file_response(request, file_path, "video/mp4")
 
 
 @app.get("/reports/{report_name}")
 def get_report(
     report_name: str,
+    request: Request,
     authorization: str | None = Header(default=None),
     token: str | None = Query(default=None),
 ):
@@ -97,12 +102,13 @@ def get_report(
     file_path = os.path.join(REPORTS_DIR, safe_name)
     if not os.path.isfile(file_path):
         raise HTTPException(status_code=404, detail="Report not found")
-    return FileResponse(file_path, media_type="application/json")
+    return evidence_file_response(request, file_path, "application/json")
 
 
 @app.get("/incident-images/{image_name}")
 def get_incident_image(
     image_name: str,
+    request: Request,
     authorization: str | None = Header(default=None),
     token: str | None = Query(default=None),
 ):
@@ -114,11 +120,12 @@ def get_incident_image(
     file_path = os.path.join(IMAGES_DIR, safe_name)
     if not os.path.isfile(file_path):
         raise HTTPException(status_code=404, detail="Image not found")
-    return FileResponse(file_path, media_type="image/jpeg")
+    return evidence_file_response(request, file_path, "image/jpeg")
 
 
 # --- INIT DB ---
 init_db()
+start_event_flusher()
 start_incident_worker()
 
 # --- INCLUDE ROUTERS ---
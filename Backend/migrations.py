@@ -0,0 +1,442 @@
+import sqlite3
+import sys
+from datetime import datetime
+
+from incident_rollups import backfill_rollups, create_rollup_tables
+
+
+def _ensure_column(cursor, table_name, column_name, definition):
+    cursor.execute(f"PRAGMA table_info({table_name})")
+    columns = {row[1] for row in cursor.fetchall()}
+    if column_name not in columns:
+        cursor.execute(
+            f"ALTER TABLE {table_name} "
+            f"ADD COLUMN {column_name} {definition}"
+        )
+
+
+def _baseline(c) -> None:
+    # The schema as init_db built it before versioning. Every statement is
+    # idempotent so databases created by older builds upgrade cleanly.
+    # c.execute('''DROP TABLE IF EXISTS users''')
+    # Do not drop users table.
+    c.execute("""CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        email TEXT NOT NULL UNIQUE,
+        password TEXT NOT NULL,
+        role TEXT DEFAULT 'user',
+        verified INTEGER DEFAULT 0
+    )""")
+    c.execute("""CREATE TABLE IF NOT EXISTS people (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        extra TEXT,
+        admin INTEGER DEFAULT 0
+    )""")
+    c.execute("""CREATE TABLE IF NOT EXISTS incidents (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        type TEXT NOT NULL,
+        description TEXT,
+        status TEXT DEFAULT 'Open',
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        clip_path TEXT
+    )""")
+    _ensure_column(c, "incidents", "source", "TEXT DEFAULT 'manual'")
+    _ensure_column(c, "incidents", "confidence", "REAL")
+    _ensure_column(c, "incidents", "evidence_image", "TEXT")
+    _ensure_column(c, "incidents", "report_path", "TEXT")
+    _ensure_column(c, "incidents", "camera_id", "INTEGER")
+    _ensure_column(c, "incidents", "event_id", "INTEGER")
+    _ensure_column(c, "incidents", "updated_at", "TEXT")
+    c.execute("""CREATE TABLE IF NOT EXISTS incident_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        incident_type TEXT NOT NULL,
+        camera_id INTEGER,
+        state TEXT NOT NULL,
+        started_at TEXT NOT NULL,
+        last_seen_at TEXT NOT NULL,
+        resolved_at TEXT,
+        incident_count INTEGER DEFAULT 0
+    )""")
+    c.execute("""CREATE TABLE IF NOT EXISTS incident_audit (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        incident_id INTEGER,
+        status TEXT,
+        changed_at TEXT
+    )""")
+    c.execute("""CREATE TABLE IF NOT EXISTS feedback (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        incident_id INTEGER,
+        comment TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )""")
+    # Rows from before updated_at existed take their last status change,
+    # or their creation time, so delta syncs start from a sane point.
+    c.execute("""UPDATE incidents SET updated_at = COALESCE(
+        (SELECT MAX(changed_at) FROM incident_audit
+         WHERE incident_audit.incident_id = incidents.id),
+        REPLACE(created_at, ' ', 'T')
+    ) WHERE updated_at IS NULL""")
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_incidents_updated_at "
+        "ON incidents (updated_at, id)"
+    )
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_incidents_created_at "
+        "ON incidents (created_at, id)"
+    )
+    c.execute("""CREATE TABLE IF NOT EXISTS incident_jobs (
+        id TEXT PRIMARY KEY,
+        state TEXT NOT NULL DEFAULT 'pending',
+        payload TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        available_at REAL NOT NULL,
+        lease_owner TEXT,
+        lease_expires_at REAL,
+        last_error TEXT,
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL
+    )""")
+    c.execute("""CREATE TABLE IF NOT EXISTS settings (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    )""")
+
+
+def _hot_path_indexes(c) -> None:
+    # Incident listing filters, each ordered the way the list endpoint
+    # pages (created_at DESC, id DESC) so no sort step is needed.
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_incidents_status_created "
+        "ON incidents (status, created_at, id)"
+    )
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_incidents_type_created "
+        "ON incidents (type, created_at, id)"
+    )
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_incidents_camera_created "
+        "ON incidents (camera_id, created_at, id)"
+    )
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_incidents_event "
+        "ON incidents (event_id, created_at, id)"
+    )
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_incident_events_lookup "
+        "ON incident_events (incident_type, camera_id, state)"
+    )
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_incident_events_open "
+        "ON incident_events (state, last_seen_at)"
+    )
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_incident_audit_incident "
+        "ON incident_audit (incident_id, changed_at)"
+    )
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_feedback_incident "
+        "ON feedback (incident_id)"
+    )
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_incident_jobs_state "
+        "ON incident_jobs (state, available_at)"
+    )
+
+
+def _incident_rollups(c) -> None:
+    create_rollup_tables(c)
+    backfill_rollups(c)
+
+
+def _incident_search(c) -> None:
+    # One row per incident (rowid = incident id) holding its description and
+    # all of its feedback comments, kept current by triggers.
+    c.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS incident_search
+        USING fts5(description, comments, tokenize='unicode61')""")
+    comments = """COALESCE((SELECT group_concat(comment, char(10))
+        FROM feedback WHERE incident_id = {id}), '')"""
+    c.execute("""CREATE TRIGGER IF NOT EXISTS incident_search_insert
+        AFTER INSERT ON incidents BEGIN
+        INSERT INTO incident_search (rowid, description, comments)
+        VALUES (new.id, COALESCE(new.description, ''), '');
+    END""")
+    c.execute("""CREATE TRIGGER IF NOT EXISTS incident_search_update
+        AFTER UPDATE OF description ON incidents BEGIN
+        UPDATE incident_search SET description = COALESCE(new.description, '')
+        WHERE rowid = new.id;
+    END""")
+    c.execute("""CREATE TRIGGER IF NOT EXISTS incident_search_delete
+        AFTER DELETE ON incidents BEGIN
+        DELETE FROM incident_search WHERE rowid = old.id;
+    END""")
+    for event, row in (
+        ("INSERT", "new"),
+        ("UPDATE", "new"),
+        ("DELETE", "old"),
+    ):
+        c.execute(f"""CREATE TRIGGER IF NOT EXISTS
+            incident_search_feedback_{event.lower()}
+            AFTER {event} ON feedback BEGIN
+            UPDATE incident_search
+            SET comments = {comments.format(id=f"{row}.incident_id")}
+            WHERE rowid = {row}.incident_id;
+        END""")
+    c.execute(
+        "CREATE TRIGGER IF NOT EXISTS incident_search_feedback_move "
+        "AFTER UPDATE OF incident_id ON feedback BEGIN "
+        "UPDATE incident_search "
+        f"SET comments = {comments.format(id='old.incident_id')} "
+        "WHERE rowid = old.incident_id; END"
+    )
+    c.execute("DELETE FROM incident_search")
+    c.execute(f"""INSERT INTO incident_search (rowid, description, comments)
+        SELECT id, COALESCE(description, ''),
+        {comments.format(id='incidents.id')} FROM incidents""")
+
+
+# Tables whose changes are counted in table_versions; list endpoints derive
+# their ETag and Last-Modified from these counters.
+VERSIONED_TABLES = (
+    "incidents",
+    "incident_events",
+    "incident_audit",
+    "feedback",
+    "people",
+)
+# Seconds since the epoch, with sub-second precision.
+_EPOCH_NOW_SQL = "(julianday('now') - 2440587.5) * 86400.0"
+
+
+def _table_versions(c) -> None:
+    c.execute("""CREATE TABLE IF NOT EXISTS table_versions (
+        name TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0,
+        changed_at REAL NOT NULL
+    ) WITHOUT ROWID""")
+    for table in VERSIONED_TABLES:
+        c.execute(
+            (
+                "INSERT OR IGNORE INTO table_versions "
+                f"(name, version, changed_at) VALUES (?, 0, {_EPOCH_NOW_SQL})"
+            ),
+            (table,),
+        )
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            c.execute(f"""CREATE TRIGGER IF NOT EXISTS
+                {table}_version_{event.lower()}
+                AFTER {event} ON {table} BEGIN
+                UPDATE table_versions
+                SET version = version + 1, changed_at = {_EPOCH_NOW_SQL}
+                WHERE name = '{table}';
+            END""")
+
+
+def _incident_job_ids(c) -> None:
+    # The incident job that created an incident, unique so a job retried
+    # after a lost lease never inserts a second one.
+    _ensure_column(c, "incidents", "job_id", "TEXT")
+    c.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_incidents_job "
+        "ON incidents (job_id) WHERE job_id IS NOT NULL"
+    )
+
+
+def _incident_change_seq(c) -> None:
+    # Delta sync orders incidents by this counter rather than updated_at,
+    # whose millisecond stamps can tie across commits. Existing rows share
+    # the first value and are ordered by id.
+    _ensure_column(c, "incidents", "change_seq", "INTEGER")
+    c.execute(
+        (
+            "INSERT OR IGNORE INTO table_versions "
+            f"(name, version, changed_at) VALUES (?, 1, {_EPOCH_NOW_SQL})"
+        ),
+        ("incident_changes",),
+    )
+    c.execute("UPDATE incidents SET change_seq = 1 WHERE change_seq IS NULL")
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_incidents_change_seq "
+        "ON incidents (change_seq, id)"
+    )
+
+
+def _incident_tombstones(c) -> None:
+    # Deleted incident ids with the change sequence of their deletion, so
+    # delta sync can tell clients what to drop.
+    c.execute("""CREATE TABLE IF NOT EXISTS incident_tombstones (
+        incident_id INTEGER PRIMARY KEY,
+        change_seq INTEGER NOT NULL
+    )""")
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_incident_tombstones_change_seq "
+        "ON incident_tombstones (change_seq)"
+    )
+
+
+def _tombstone_times(c) -> None:
+    # Lets updated_since delta syncs find deletions. Existing tombstones
+    # take the time of their "Deleted" audit entry.
+    _ensure_column(c, "incident_tombstones", "deleted_at", "TEXT")
+    c.execute("""UPDATE incident_tombstones SET deleted_at = (
+        SELECT MAX(changed_at) FROM incident_audit
+        WHERE incident_audit.incident_id = incident_tombstones.incident_id
+        AND incident_audit.status = 'Deleted'
+    ) WHERE deleted_at IS NULL""")
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_incident_tombstones_deleted_at "
+        "ON incident_tombstones (deleted_at)"
+    )
+
+
+# Append only: a released migration never changes, fixes go in a new one.
+MIGRATIONS = [
+    (1, "baseline", _baseline),
+    (2, "hot path indexes", _hot_path_indexes),
+    (3, "incident rollups", _incident_rollups),
+    (4, "incident search", _incident_search),
+    (5, "table versions", _table_versions),
+    (6, "incident job ids", _incident_job_ids),
+    (7, "incident change sequence", _incident_change_seq),
+    (8, "incident tombstones", _incident_tombstones),
+    (9, "tombstone times", _tombstone_times),
+]
+
+# Queries on request and worker paths. check_query_plans() fails if any of
+# them is planned as a full table scan.
+HOT_QUERIES = [
+    (
+        "SELECT id FROM incidents WHERE status = ? "
+        "ORDER BY created_at DESC, id DESC LIMIT ?"
+    ),
+    (
+        "SELECT id FROM incidents WHERE type = ? "
+        "ORDER BY created_at DESC, id DESC LIMIT ?"
+    ),
+    (
+        "SELECT id FROM incidents WHERE camera_id = ? "
+        "ORDER BY created_at DESC, id DESC LIMIT ?"
+    ),
+    (
+        "SELECT id FROM incidents WHERE event_id = ? "
+        "ORDER BY created_at DESC, id DESC LIMIT ?"
+    ),
+    (
+        "SELECT id FROM incidents WHERE created_at >= ? AND created_at < ? "
+        "ORDER BY created_at DESC, id DESC LIMIT ?"
+    ),
+    (
+        "SELECT id FROM incidents WHERE (created_at, id) < (?, ?) "
+        "ORDER BY created_at DESC, id DESC LIMIT ?"
+    ),
+    (
+        "SELECT id FROM incidents WHERE (change_seq, id) > (?, ?) "
+        "ORDER BY change_seq, id LIMIT ?"
+    ),
+    (
+        "SELECT change_seq FROM incidents WHERE updated_at >= ? "
+        "ORDER BY updated_at LIMIT 1"
+    ),
+    (
+        "SELECT change_seq FROM incident_tombstones WHERE deleted_at >= ? "
+        "ORDER BY deleted_at LIMIT 1"
+    ),
+    (
+        "SELECT incident_id FROM incident_tombstones "
+        "WHERE change_seq > ? AND change_seq <= ? ORDER BY change_seq"
+    ),
+    (
+        "SELECT id, incident_type, camera_id, state, last_seen_at, "
+        "incident_count FROM incident_events "
+        "WHERE state IN ('start','active') ORDER BY id"
+    ),
+    (
+        "UPDATE incident_events SET state='resolved', resolved_at=? "
+        "WHERE id=? AND state IN ('start','active')"
+    ),
+    (
+        "SELECT status, changed_at FROM incident_audit "
+        "WHERE incident_id=? ORDER BY changed_at DESC"
+    ),
+    "SELECT id, comment FROM feedback WHERE incident_id=?",
+    (
+        "SELECT id FROM incident_jobs "
+        "WHERE (state='pending' AND available_at<=?) "
+        "OR (state='leased' AND lease_expires_at<=?) "
+        "ORDER BY available_at, created_at LIMIT 1"
+    ),
+    (
+        "SELECT bucket, SUM(count) FROM incident_rollup_daily "
+        "WHERE bucket >= ? AND bucket < ? GROUP BY bucket"
+    ),
+    (
+        "SELECT bucket, SUM(count) FROM incident_rollup_hourly "
+        "WHERE bucket >= ? AND bucket < ? GROUP BY bucket"
+    ),
+    "SELECT version, changed_at FROM table_versions WHERE name IN (?, ?)",
+    "SELECT id FROM users WHERE email=?",
+    "SELECT id FROM incidents WHERE job_id=?",
+    "SELECT id FROM users WHERE id=?",
+]
+
+
+def get_schema_version(conn) -> int:
+    conn.execute("""CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TEXT NOT NULL
+    )""")
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return int(row[0] or 0)
+
+
+def run_migrations(conn) -> int:
+    # Runs inside the caller's transaction, so a failing migration leaves
+    # the schema untouched. Returns the resulting schema version.
+    current = get_schema_version(conn)
+    c = conn.cursor()
+    for version, name, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+        migrate(c)
+        c.execute(
+            (
+                "INSERT INTO schema_version (version, name, applied_at) "
+                "VALUES (?, ?, ?)"
+            ),
+            (version, name, datetime.utcnow().isoformat()),
+        )
+        current = version
+    return current
+
+
+def _full_scans(conn, query: str) -> list[str]:
+    params = [None] * query.count("?")
+    plan = conn.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()
+    # A SCAN step walks the whole table, or a whole index, even when it
+    # is in index order; hot queries must SEARCH.
+    return [row[3] for row in plan if row[3].startswith("SCAN ")]
+
+
+def check_query_plans(conn) -> list[str]:
+    # Returns one message per hot query that regressed to a full scan.
+    problems = []
+    for query in HOT_QUERIES:
+        for step in _full_scans(conn, query):
+            problems.append(f"{step}: {query}")
+    return problems
+
+
+if __name__ == "__main__":
+    # Migrates a scratch database and checks every hot query plan against
+    # it: python migrations.py [path]
+    path = sys.argv[1] if len(sys.argv) > 1 else ":memory:"
+    with sqlite3.connect(path) as db:
+        run_migrations(db)
+        failures = check_query_plans(db)
+    for failure in failures:
+        print(f"Full table scan: {failure}")
+    if failures:
+        sys.exit(1)
+    print(f"{len(HOT_QUERIES)} hot queries use indexes.")
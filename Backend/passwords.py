@@ -0,0 +1,94 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from dotenv import load_dotenv
+from passlib.context import CryptContext
+
+load_dotenv(os.path.join(os.path.dirname(__file__), ".env"))
+
+# bcrypt cost for new hashes. Stored hashes with a different cost are
+# rehashed the next time their owner logs in.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Processes doing bcrypt work, kept off the request threadpool.
+PASSWORD_WORKERS = max(1, int(os.getenv("PASSWORD_WORKERS", "2")))
+# Hash/verify calls in flight, queued ones included. Requests beyond this
+# wait up to PASSWORD_WAIT_SECONDS for a slot, then are refused instead of
+# piling up behind the workers.
+PASSWORD_CONCURRENCY = max(
+    1, int(os.getenv("PASSWORD_CONCURRENCY", str(PASSWORD_WORKERS * 4)))
+)
+PASSWORD_WAIT_SECONDS = float(os.getenv("PASSWORD_WAIT_SECONDS", "2"))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS
+)
+
+
+class PasswordBusy(Exception):
+    pass
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify_and_update(
+    password: str, hashed: str
+) -> tuple[bool, str | None]:
+    return pwd_context.verify_and_update(password, hashed)
+
+
+_executor: ProcessPoolExecutor | None = None
+_executor_lock = threading.Lock()
+# Created on first use, inside the server's event loop.
+_slots: asyncio.Semaphore | None = None
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn, not fork: forking a process that already runs database
+            # and worker threads can leave children stuck on copied locks.
+            _executor = ProcessPoolExecutor(
+                max_workers=PASSWORD_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+
+async def _run(fn, *args):
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(PASSWORD_CONCURRENCY)
+    try:
+        await asyncio.wait_for(_slots.acquire(), PASSWORD_WAIT_SECONDS)
+    except asyncio.TimeoutError:
+        raise PasswordBusy()
+    loop = asyncio.get_running_loop()
+    try:
+        future = _get_executor().submit(fn, *args)
+    except BaseException:
+        _slots.release()
+        raise
+    # The slot is held until the work itself finishes, even when the
+    # request waiting on it goes away.
+    future.add_done_callback(
+        lambda _: loop.call_soon_threadsafe(_slots.release)
+    )
+    return await asyncio.wrap_future(future)
+
+
+async def hash_password(password: str) -> str:
+    return await _run(_hash, password)
+
+
+async def verify_password(
+    password: str, hashed: str
+) -> tuple[bool, str | None]:
+    # Returns (matches, new_hash); new_hash is set when the stored hash
+    # uses outdated settings and should be replaced.
+    return await _run(_verify_and_update, password, hashed)
@@ -50,14 +50,14 @@ def get_pose_model_path() -> str | None:
     return _pose_model_path
 
 
-def detect_pose(img):
+def detect_pose(img, imgsz=640):
     model = get_pose_model()
     if not model:
         return []
 
     results = model(
         img,
-        imgsz=640,
+        imgsz=imgsz,
         device="cuda" if cv2.cuda.getCudaEnabledDeviceCount() > 0 else "cpu",
     )
 
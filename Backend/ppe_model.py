@@ -1,5 +1,6 @@
 import os
 from ultralytics import YOLO
+from tiled_inference import predict_tiled, tiling_enabled, tiling_kwargs
 
 CLASS_NAMES = [
     "Hardhat",
@@ -31,11 +32,27 @@ def unload_ppe_model() -> None:
     _ppe_model = None
 
 
-def detect_ppe(img):
+def _label(cls: int) -> str:
+    return CLASS_NAMES[cls] if cls < len(CLASS_NAMES) else str(cls)
+
+
+def detect_ppe(img, tiling: dict | None = None, imgsz: int | None = None):
     model = get_ppe_model()
     if not model:
         return []
-    results = model(img)
+    if tiling_enabled(tiling):
+        boxes, scores, classes = predict_tiled(
+            model, img, **tiling_kwargs(tiling)
+        )
+        return [
+            {
+                "bbox": [int(v) for v in box],
+                "confidence": float(conf),
+                "label": _label(int(cls)),
+            }
+            for box, conf, cls in zip(boxes, scores, classes)
+        ]
+    results = model(img, imgsz=imgsz) if imgsz else model(img)
     detections = []
     for r in results:
         boxes = r.boxes
@@ -43,7 +60,7 @@ def detect_ppe(img):
             x1, y1, x2, y2 = box.xyxy[0]
             conf = float(box.conf[0])
             cls = int(box.cls[0])
-            label = CLASS_NAMES[cls] if cls < len(CLASS_NAMES) else str(cls)
+            label = _label(cls)
             detections.append(
                 {
                     "bbox": [int(x1), int(y1), int(x2), int(y2)],
@@ -1,25 +1,161 @@
 # realtime.py - WebSocket manager for incident updates
+import asyncio
+import json
+import time
+from collections import deque
+
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from typing import List
 
 router = APIRouter()
 
+# Messages buffered per client before it is treated as a slow consumer.
+CLIENT_QUEUE_SIZE = 100
+SEND_TIMEOUT_SECONDS = 10.0
+# "Try again later": the client fell behind and should reconnect.
+SLOW_CONSUMER_CLOSE_CODE = 1013
+# Recent messages kept so reconnecting clients can resume with ?since=seq.
+REPLAY_BUFFER_SIZE = 500
+
+
+class _Client:
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.queue: asyncio.Queue[str] = asyncio.Queue(
+            maxsize=CLIENT_QUEUE_SIZE
+        )
+        self.task: asyncio.Task | None = None
+
 
 class ConnectionManager:
+    # Every connection gets its own bounded queue and writer task, so one
+    # slow or dead client never blocks delivery to the others.
     def __init__(self):
-        self.active_connections: List[WebSocket] = []
+        self.clients: dict[WebSocket, _Client] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+        # Sequence numbers follow wall-clock milliseconds where possible, so
+        # they keep increasing across restarts and map back to a point in
+        # time for the database fallback. Everything at or below
+        # _replay_floor is no longer (or never was) in the replay buffer.
+        self._seq = int(time.time() * 1000)
+        self._replay_floor = self._seq
+        self._replay: deque[tuple[int, str]] = deque()
+
+    @property
+    def active_connections(self) -> list[WebSocket]:
+        return list(self.clients)
 
-    async def connect(self, websocket: WebSocket):
+    @property
+    def seq(self) -> int:
+        return self._seq
+
+    def _next_seq(self) -> int:
+        self._seq = max(self._seq + 1, int(time.time() * 1000))
+        return self._seq
+
+    def _replay_since(self, since: int) -> list[str] | None:
+        # None when events after `since` have already left the buffer.
+        if since < self._replay_floor:
+            return None
+        return [text for seq, text in self._replay if seq > since]
+
+    async def connect(
+        self, websocket: WebSocket, since: int | None = None
+    ) -> bool:
+        # Returns True when the client asked to resume from a point that
+        # the replay buffer no longer covers and has to catch up through
+        # delta sync.
         await websocket.accept()
-        self.active_connections.append(websocket)
+        self._loop = asyncio.get_running_loop()
+        client = _Client(websocket)
+        client.queue.put_nowait(
+            json.dumps({"type": "hello", "seq": self._seq})
+        )
+        needs_resync = False
+        if since is not None:
+            missed = self._replay_since(since)
+            if missed is None or len(missed) >= CLIENT_QUEUE_SIZE:
+                needs_resync = True
+            else:
+                for text in missed:
+                    client.queue.put_nowait(text)
+        # No await between reading the replay buffer and registering the
+        # client, so no broadcast can fall in between.
+        client.task = asyncio.create_task(self._writer(client))
+        self.clients[websocket] = client
+        return needs_resync
+
+    def send_to(self, websocket: WebSocket, message: dict) -> None:
+        client = self.clients.get(websocket)
+        if client is None:
+            return
+        try:
+            client.queue.put_nowait(json.dumps(message, default=str))
+        except asyncio.QueueFull:
+            self._evict(client)
 
     def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
+        client = self.clients.pop(websocket, None)
+        if (
+            client is not None
+            and client.task is not None
+            and client.task is not asyncio.current_task()
+        ):
+            client.task.cancel()
+
+    async def _writer(self, client: _Client):
+        try:
+            while True:
+                text = await client.queue.get()
+                await asyncio.wait_for(
+                    client.websocket.send_text(text), SEND_TIMEOUT_SECONDS
+                )
+        except asyncio.CancelledError:
+            raise
+        except Exception:  # noqa: BLE001
+            self._evict(client)
+
+    def _evict(self, client: _Client):
+        self.disconnect(client.websocket)
+        asyncio.ensure_future(self._close(client.websocket))
+
+    async def _close(self, websocket: WebSocket):
+        try:
+            await websocket.close(code=SLOW_CONSUMER_CLOSE_CODE)
+        except Exception:  # noqa: BLE001
+            pass
+
+    def _broadcast_now(self, message: dict):
+        # Must run on the server loop. The message is serialized once and
+        # the same text is queued for every client.
+        seq = self._next_seq()
+        text = json.dumps({**message, "seq": seq}, default=str)
+        self._replay.append((seq, text))
+        if len(self._replay) > REPLAY_BUFFER_SIZE:
+            self._replay_floor = self._replay.popleft()[0]
+        for client in list(self.clients.values()):
+            try:
+                client.queue.put_nowait(text)
+            except asyncio.QueueFull:
+                self._evict(client)
 
     async def broadcast(self, message: dict):
-        for connection in self.active_connections:
-            await connection.send_json(message)
+        self._broadcast_now(message)
+
+    def publish(self, message: dict) -> bool:
+        # Safe to call from any thread, including worker threads without an
+        # event loop of their own.
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return False
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._broadcast_now(message)
+        else:
+            loop.call_soon_threadsafe(self._broadcast_now, message)
+        return True
 
 
 manager = ConnectionManager()
@@ -27,14 +163,39 @@ manager = ConnectionManager()
 
 @router.websocket("/ws/incidents")
 async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
     try:
+        since = int(websocket.query_params["since"])
+    except (KeyError, ValueError):
+        since = None
+    needs_resync = await manager.connect(websocket, since)
+    try:
+        if needs_resync:
+            # The missed events could be status changes or deletions, not
+            # just new incidents; the client runs a delta sync from its own
+            # token, which covers all of them.
+            manager.send_to(websocket, {"type": "resync", "seq": manager.seq})
         while True:
             await websocket.receive_text()  # Keep connection alive
-    except WebSocketDisconnect:
+    except (WebSocketDisconnect, RuntimeError):
+        # RuntimeError: the socket was closed by slow-consumer eviction.
+        pass
+    finally:
         manager.disconnect(websocket)
 
 
-# Utility for other modules to broadcast
-async def broadcast_incident(incident: dict):
-    await manager.broadcast({"type": "incident", "data": incident})
+# Utility for other modules to broadcast; callable from any thread.
+def publish_incident(incident: dict) -> bool:
+    return manager.publish({"type": "incident", "data": incident})
+
+
+def publish_incidents_bulk(action: str, ids: list[int], **details) -> bool:
+    # One event for a whole bulk change instead of one per incident.
+    return manager.publish(
+        {
+            "type": "incidents_bulk",
+            "action": action,
+            "ids": ids,
+            "count": len(ids),
+            **details,
+        }
+    )
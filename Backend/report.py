@@ -1,135 +1,348 @@
-from fastapi import APIRouter, Depends, Response
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+import asyncio
 import csv
 import io
-import sqlite3
-from database import get_db
+import zlib
+from datetime import datetime
+from database import fetch_all
+from incident_service import incident_filters, time_range_filters
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet/Arrow exports are optional.
+    pa = None
+    pq = None
 
 router = APIRouter()
 
+# Rows pulled from the cursor per chunk written to the client.
+EXPORT_BATCH_ROWS = 500
+# Rows per Arrow record batch (and Parquet row group).
+COLUMNAR_BATCH_ROWS = 8192
+EXPORT_FORMATS = {"csv", "parquet", "arrow"}
+EVENT_STATES = {"start", "active", "resolved"}
 
-@router.get("/report/fall", response_class=Response)
-def generate_fall_report(db: sqlite3.Connection = Depends(get_db)):
-    c = db.cursor()
-    c.execute(
-        (
-            "SELECT id, type, description, status, created_at, clip_path, "
-            "camera_id, event_id "
-            "FROM incidents WHERE type=? ORDER BY created_at DESC"
-        ),
-        ("fall",),
-    )
-    rows = c.fetchall()
-
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(
-        [
-            "ID",
-            "Type",
-            "Description",
-            "Status",
-            "Created At",
-            "Clip Path",
-            "Camera ID",
-            "Event ID",
-        ]
-    )
-    for row in rows:
-        writer.writerow(row)
-    csv_content = output.getvalue()
-    output.close()
-
-    return Response(
-        content=csv_content,
-        media_type="text/csv",
-        headers={
-            "Content-Disposition": "attachment; filename=fall_report.csv"
-        },
-    )
+# (CSV header, column, type) for each export.
+INCIDENT_EXPORT_COLUMNS = [
+    ("ID", "id", "int"),
+    ("Type", "type", "str"),
+    ("Description", "description", "str"),
+    ("Status", "status", "str"),
+    ("Created At", "created_at", "time"),
+    ("Clip Path", "clip_path", "str"),
+    ("Source", "source", "str"),
+    ("Confidence", "confidence", "float"),
+    ("Evidence Image", "evidence_image", "str"),
+    ("Report Path", "report_path", "str"),
+    ("Camera ID", "camera_id", "int"),
+    ("Event ID", "event_id", "int"),
+]
+FALL_EXPORT_COLUMNS = [
+    column
+    for column in INCIDENT_EXPORT_COLUMNS
+    if column[1]
+    not in {"source", "confidence", "evidence_image", "report_path"}
+]
+EVENT_EXPORT_COLUMNS = [
+    ("Event ID", "id", "int"),
+    ("Incident Type", "incident_type", "str"),
+    ("Camera ID", "camera_id", "int"),
+    ("State", "state", "str"),
+    ("Started At", "started_at", "time"),
+    ("Last Seen At", "last_seen_at", "time"),
+    ("Resolved At", "resolved_at", "time"),
+    ("Incident Count", "incident_count", "int"),
+]
 
 
-@router.get("/report/incidents", response_class=Response)
-def generate_incidents_report(db: sqlite3.Connection = Depends(get_db)):
-    c = db.cursor()
-    c.execute(
-        (
-            "SELECT id, type, description, status, created_at, clip_path, "
-            "source, confidence, evidence_image, report_path, camera_id, "
-            "event_id "
-            "FROM incidents ORDER BY created_at DESC"
+async def _iter_batches(
+    table: str,
+    columns: list,
+    filters: list,
+    params: list,
+    keys: tuple[str, ...],
+    size: int,
+):
+    # Keyset pages in descending `keys` order. A pooled reader is held per
+    # page only, so a slow download never keeps one checked out between
+    # fetches; each page starts after the last row of the previous one.
+    names = [name for _, name, _ in columns]
+    positions = [names.index(key) for key in keys]
+    order = ", ".join(f"{key} DESC" for key in keys)
+    after = None
+    while True:
+        page_filters = list(filters)
+        page_params = list(params)
+        if after is not None:
+            page_filters.append(
+                f"({', '.join(keys)}) < ({', '.join('?' for _ in keys)})"
+            )
+            page_params.extend(after)
+        rows = await fetch_all(
+            (
+                f"SELECT {_select(columns)} FROM {table}"
+                f"{_where(page_filters)} ORDER BY {order} LIMIT ?"
+            ),
+            page_params + [size],
         )
+        if rows:
+            yield rows
+        if len(rows) < size:
+            break
+        after = [rows[-1][position] for position in positions]
+
+
+async def _stream_csv(source: tuple, header: list, gzip: bool):
+    compressor = zlib.compressobj(wbits=31) if gzip else None
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def encode() -> bytes:
+        chunk = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+        if compressor is not None:
+            # Sync-flush each batch so compressed output is not held back
+            # until the end of the export.
+            chunk = compressor.compress(chunk) + compressor.flush(
+                zlib.Z_SYNC_FLUSH
+            )
+        return chunk
+
+    writer.writerow(header)
+    yield encode()
+    async for rows in _iter_batches(*source, EXPORT_BATCH_ROWS):
+        writer.writerows(rows)
+        yield encode()
+    if compressor is not None:
+        yield compressor.flush()
+
+
+class _ChunkSink(io.RawIOBase):
+    # Write-only file for the Arrow writers that hands out what has been
+    # written so far. tell() keeps counting across drains, since Parquet
+    # records absolute offsets in its footer.
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _parse_time(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+def _arrow_schema(columns: list):
+    types = {
+        "int": pa.int64(),
+        "float": pa.float64(),
+        "str": pa.string(),
+        "time": pa.timestamp("us"),
+    }
+    return pa.schema(
+        [pa.field(name, types[kind]) for _, name, kind in columns]
     )
-    rows = c.fetchall()
-
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(
-        [
-            "ID",
-            "Type",
-            "Description",
-            "Status",
-            "Created At",
-            "Clip Path",
-            "Source",
-            "Confidence",
-            "Evidence Image",
-            "Report Path",
-            "Camera ID",
-            "Event ID",
-        ]
-    )
-    for row in rows:
-        writer.writerow(row)
-    csv_content = output.getvalue()
-    output.close()
-
-    return Response(
-        content=csv_content,
-        media_type="text/csv",
-        headers={
-            "Content-Disposition": "attachment; filename=incidents_report.csv"
-        },
+
+
+def _write_batch(writer, schema, columns: list, rows: list) -> None:
+    arrays = []
+    for index, (_, _, kind) in enumerate(columns):
+        values = [row[index] for row in rows]
+        if kind == "time":
+            values = [_parse_time(value) for value in values]
+        arrays.append(pa.array(values, schema.types[index]))
+    writer.write_batch(pa.record_batch(arrays, schema=schema))
+
+
+async def _stream_columnar(source: tuple, columns: list, fmt: str):
+    schema = _arrow_schema(columns)
+    sink = _ChunkSink()
+    if fmt == "parquet":
+        writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    else:
+        writer = pa.ipc.new_file(sink, schema)
+    async for rows in _iter_batches(*source, COLUMNAR_BATCH_ROWS):
+        # Building and encoding a batch is CPU work; keep it off the loop
+        # and off the database threads.
+        await asyncio.to_thread(_write_batch, writer, schema, columns, rows)
+        chunk = sink.drain()
+        if chunk:
+            yield chunk
+    writer.close()
+    yield sink.drain()
+
+
+def _export_response(
+    table: str,
+    columns: list,
+    filters: list,
+    params: list,
+    keys: tuple[str, ...],
+    basename: str,
+    fmt: str,
+    gzip: bool,
+) -> StreamingResponse:
+    # Rows are exported newest first, in descending `keys` order.
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="Invalid export format")
+    source = (table, columns, filters, params, keys)
+    if fmt == "csv":
+        filename = f"{basename}.csv.gz" if gzip else f"{basename}.csv"
+        content = _stream_csv(
+            source, [header for header, _, _ in columns], gzip
+        )
+        media_type = "application/gzip" if gzip else "text/csv"
+    else:
+        if pa is None:
+            raise HTTPException(
+                status_code=501,
+                detail=f"{fmt} export requires pyarrow to be installed",
+            )
+        # Both formats compress internally; gzip only applies to CSV.
+        filename = f"{basename}.{fmt}"
+        content = _stream_columnar(source, columns, fmt)
+        media_type = (
+            "application/vnd.apache.parquet"
+            if fmt == "parquet"
+            else "application/vnd.apache.arrow.file"
+        )
+    return StreamingResponse(
+        content,
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
     )
 
 
-@router.get("/report/incident-events", response_class=Response)
-def generate_incident_events_report(db: sqlite3.Connection = Depends(get_db)):
-    c = db.cursor()
-    c.execute(
-        (
-            "SELECT id, incident_type, camera_id, state, started_at, "
-            "last_seen_at, resolved_at, incident_count "
-            "FROM incident_events ORDER BY id DESC"
+def _select(columns: list) -> str:
+    return ", ".join(name for _, name, _ in columns)
+
+
+def _where(filters: list) -> str:
+    return " WHERE " + " AND ".join(filters) if filters else ""
+
+
+@router.get("/report/fall")
+async def generate_fall_report(
+    status: str | None = None,
+    camera_id: int | None = None,
+    created_from: str | None = None,
+    created_to: str | None = None,
+    format: str = "csv",
+    gzip: bool = False,
+):
+    try:
+        filters, params = incident_filters(
+            status=status,
+            incident_type="fall",
+            camera_id=camera_id,
+            created_from=created_from,
+            created_to=created_to,
         )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _export_response(
+        "incidents",
+        FALL_EXPORT_COLUMNS,
+        filters,
+        params,
+        ("created_at", "id"),
+        "fall_report",
+        format,
+        gzip,
     )
-    rows = c.fetchall()
-
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(
-        [
-            "Event ID",
-            "Incident Type",
-            "Camera ID",
-            "State",
-            "Started At",
-            "Last Seen At",
-            "Resolved At",
-            "Incident Count",
-        ]
+
+
+@router.get("/report/incidents")
+async def generate_incidents_report(
+    status: str | None = None,
+    type: str | None = None,
+    camera_id: int | None = None,
+    created_from: str | None = None,
+    created_to: str | None = None,
+    format: str = "csv",
+    gzip: bool = False,
+):
+    try:
+        filters, params = incident_filters(
+            status=status,
+            incident_type=type,
+            camera_id=camera_id,
+            created_from=created_from,
+            created_to=created_to,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _export_response(
+        "incidents",
+        INCIDENT_EXPORT_COLUMNS,
+        filters,
+        params,
+        ("created_at", "id"),
+        "incidents_report",
+        format,
+        gzip,
     )
-    for row in rows:
-        writer.writerow(row)
-    csv_content = output.getvalue()
-    output.close()
-
-    return Response(
-        content=csv_content,
-        media_type="text/csv",
-        headers={
-            "Content-Disposition": (
-                "attachment; filename=incident_events_report.csv"
-            )
-        },
+
+
+@router.get("/report/incident-events")
+async def generate_incident_events_report(
+    status: str | None = None,
+    type: str | None = None,
+    camera_id: int | None = None,
+    started_from: str | None = None,
+    started_to: str | None = None,
+    format: str = "csv",
+    gzip: bool = False,
+):
+    # status filters on the event state (start, active or resolved).
+    if status and status not in EVENT_STATES:
+        raise HTTPException(status_code=400, detail="Invalid status filter")
+    filters = []
+    params = []
+    for column, value in (
+        ("state", status),
+        ("incident_type", type),
+        ("camera_id", camera_id),
+    ):
+        if value is not None and value != "":
+            filters.append(f"{column} = ?")
+            params.append(value)
+    try:
+        range_filters, range_params = time_range_filters(
+            "started_at",
+            started_from,
+            started_to,
+            # Event times are stored by datetime.isoformat().
+            time_format="%Y-%m-%dT%H:%M:%S",
+            names=("started_from", "started_to"),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _export_response(
+        "incident_events",
+        EVENT_EXPORT_COLUMNS,
+        filters + range_filters,
+        params + range_params,
+        ("id",),
+        "incident_events_report",
+        format,
+        gzip,
     )
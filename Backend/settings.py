@@ -1,25 +1,20 @@
 # settings.py - Detection sensitivity and app settings endpoints
-from fastapi import APIRouter, Body, Depends, HTTPException
-import sqlite3
-from database import get_db
+from fastapi import APIRouter, Body, HTTPException
+from database import execute, fetch_one
 
 router = APIRouter()
 
 
 @router.get("/settings/sensitivity")
-def get_sensitivity(db: sqlite3.Connection = Depends(get_db)):
-    c = db.cursor()
-    c.execute(
+async def get_sensitivity():
+    row = await fetch_one(
         "SELECT value FROM settings WHERE key=?", ("detection_sensitivity",)
     )
-    row = c.fetchone()
     return {"sensitivity": int(row[0]) if row else 50}
 
 
 @router.post("/settings/sensitivity")
-def set_sensitivity(
-    data: dict = Body(...), db: sqlite3.Connection = Depends(get_db)
-):
+async def set_sensitivity(data: dict = Body(...)):
     try:
         value = int(data.get("value", 50))
     except (TypeError, ValueError):
@@ -30,10 +25,8 @@ def set_sensitivity(
         raise HTTPException(
             status_code=400, detail="Sensitivity must be between 0 and 100"
         )
-    c = db.cursor()
-    c.execute(
+    await execute(
         "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
         ("detection_sensitivity", str(value)),
     )
-    db.commit()
     return {"message": "Sensitivity updated.", "sensitivity": value}
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Backend modules import each other by bare name, as when run from Backend.
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+)
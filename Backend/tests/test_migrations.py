@@ -0,0 +1,23 @@
+import sqlite3
+
+import pytest
+
+from migrations import MIGRATIONS, check_query_plans, run_migrations
+
+
+@pytest.fixture
+def db():
+    conn = sqlite3.connect(":memory:")
+    yield conn
+    conn.close()
+
+
+def test_migrations_reach_latest_version(db):
+    assert run_migrations(db) == MIGRATIONS[-1][0]
+    # Running again is a no-op.
+    assert run_migrations(db) == MIGRATIONS[-1][0]
+
+
+def test_hot_queries_use_indexes(db):
+    run_migrations(db)
+    assert check_query_plans(db) == []
@@ -0,0 +1,137 @@
+import numpy as np
+
+
+DEFAULT_TILE_SIZE = 640
+DEFAULT_TILE_OVERLAP = 0.2
+DEFAULT_TILE_IOU = 0.5
+
+
+def _tile_starts(length: int, tile_size: int, step: int) -> list[int]:
+    if length <= tile_size:
+        return [0]
+    starts = list(range(0, length - tile_size + 1, step))
+    # Last tile is aligned to the edge so the border is always covered.
+    if starts[-1] != length - tile_size:
+        starts.append(length - tile_size)
+    return starts
+
+
+def make_tiles(
+    img,
+    tile_size: int = DEFAULT_TILE_SIZE,
+    overlap: float = DEFAULT_TILE_OVERLAP,
+) -> list[tuple[int, int, np.ndarray]]:
+    height, width = img.shape[:2]
+    overlap = min(max(float(overlap), 0.0), 0.9)
+    step = max(1, int(tile_size * (1.0 - overlap)))
+    tiles = []
+    for y0 in _tile_starts(height, tile_size, step):
+        for x0 in _tile_starts(width, tile_size, step):
+            tiles.append(
+                (x0, y0, img[y0:y0 + tile_size, x0:x0 + tile_size])
+            )
+    return tiles
+
+
+def tile_count(
+    width: int,
+    height: int,
+    tile_size: int = DEFAULT_TILE_SIZE,
+    overlap: float = DEFAULT_TILE_OVERLAP,
+) -> int:
+    overlap = min(max(float(overlap), 0.0), 0.9)
+    step = max(1, int(tile_size * (1.0 - overlap)))
+    return len(_tile_starts(width, tile_size, step)) * len(
+        _tile_starts(height, tile_size, step)
+    )
+
+
+def nms(
+    boxes: np.ndarray,
+    scores: np.ndarray,
+    classes: np.ndarray,
+    iou_threshold: float = DEFAULT_TILE_IOU,
+) -> np.ndarray:
+    if len(boxes) == 0:
+        return np.empty((0,), dtype=np.int64)
+
+    # Offset boxes per class so a single pass never suppresses across
+    # classes (e.g. "Hardhat" vs "NO-Hardhat" on the same head).
+    offset = classes.astype(np.float32)[:, None] * (boxes.max() + 1.0)
+    shifted = boxes + offset
+    x1, y1, x2, y2 = shifted.T
+    areas = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        xx1 = np.maximum(x1[i], x1[rest])
+        yy1 = np.maximum(y1[i], y1[rest])
+        xx2 = np.minimum(x2[i], x2[rest])
+        yy2 = np.minimum(y2[i], y2[rest])
+        inter = np.clip(xx2 - xx1, 0, None) * np.clip(yy2 - yy1, 0, None)
+        union = areas[i] + areas[rest] - inter
+        iou = np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0)
+        order = rest[iou <= iou_threshold]
+    return np.asarray(keep, dtype=np.int64)
+
+
+def predict_tiled(
+    model,
+    img,
+    tile_size: int = DEFAULT_TILE_SIZE,
+    overlap: float = DEFAULT_TILE_OVERLAP,
+    iou_threshold: float = DEFAULT_TILE_IOU,
+    include_full_frame: bool = True,
+    **predict_kwargs,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    tiles = make_tiles(img, tile_size, overlap)
+    offsets = [(x0, y0) for x0, y0, _ in tiles]
+    batch = [tile for _, _, tile in tiles]
+    if include_full_frame and len(tiles) > 1:
+        # Downscaled full frame keeps large objects that span tiles.
+        offsets.append((0, 0))
+        batch.append(img)
+
+    predict_kwargs.setdefault("imgsz", tile_size)
+    results = model(batch, verbose=False, **predict_kwargs)
+
+    all_boxes, all_scores, all_classes = [], [], []
+    for (x0, y0), result in zip(offsets, results):
+        boxes = getattr(result, "boxes", None)
+        if boxes is None or len(boxes) == 0:
+            continue
+        xyxy = boxes.xyxy.cpu().numpy().astype(np.float32)
+        xyxy[:, [0, 2]] += x0
+        xyxy[:, [1, 3]] += y0
+        all_boxes.append(xyxy)
+        all_scores.append(boxes.conf.cpu().numpy().astype(np.float32))
+        all_classes.append(boxes.cls.cpu().numpy().astype(np.int64))
+
+    if not all_boxes:
+        return (
+            np.empty((0, 4), dtype=np.float32),
+            np.empty((0,), dtype=np.float32),
+            np.empty((0,), dtype=np.int64),
+        )
+
+    boxes = np.concatenate(all_boxes)
+    scores = np.concatenate(all_scores)
+    classes = np.concatenate(all_classes)
+    keep = nms(boxes, scores, classes, iou_threshold)
+    return boxes[keep], scores[keep], classes[keep]
+
+
+def tiling_enabled(tiling: dict | None) -> bool:
+    return bool(tiling and tiling.get("enabled"))
+
+
+def tiling_kwargs(tiling: dict) -> dict:
+    return {
+        "tile_size": int(tiling.get("tile_size", DEFAULT_TILE_SIZE)),
+        "overlap": float(tiling.get("overlap", DEFAULT_TILE_OVERLAP)),
+        "iou_threshold": float(tiling.get("iou_threshold", DEFAULT_TILE_IOU)),
+        "include_full_frame": bool(tiling.get("include_full_frame", True)),
+    }
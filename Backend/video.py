@@ -5,12 +5,14 @@ import cv2
 from camera_stream import (
     ensure_camera_started,
     get_camera_index,
-    get_frame,
+    get_frame_after,
     set_camera_index,
 )
 from live_session import deactivate_models
 from model_runtime import sleep_all_models
 from live_detection_utils import gen_live_detection
+from frame_scheduler import get_scheduler_stats
+from load_controller import get_load_levels
 
 router = APIRouter()
 
@@ -18,10 +20,12 @@ router = APIRouter()
 def gen_raw_video():
     if not ensure_camera_started():
         raise HTTPException(status_code=503, detail="Camera is not available")
+    last_seq = 0
     while True:
-        frame = get_frame(timeout_seconds=1.0)
-        if frame is None:
+        captured = get_frame_after(last_seq, timeout_seconds=1.0)
+        if captured is None:
             continue
+        frame, _, last_seq = captured
         encoded, buffer = cv2.imencode(".jpg", frame)
         if not encoded:
             continue
@@ -73,6 +77,16 @@ def get_monitoring_camera():
     return {"camera_id": get_camera_index()}
 
 
+@router.get("/monitoring/load")
+def get_monitoring_load():
+    return {"cameras": get_load_levels()}
+
+
+@router.get("/monitoring/scheduler")
+def get_monitoring_scheduler():
+    return {"cameras": get_scheduler_stats()}
+
+
 @router.get("/live/ppe")
 def live_ppe():
     return StreamingResponse(
@@ -7,6 +7,8 @@ const state = {
   sensitivity: 50,
   cameras: [],
   ws: null,
+  wsSeq: null,
+  syncToken: null,
   liveMode: "video_feed",
   livePaused: false,
   selectedCameraId: 0,
@@ -65,8 +67,9 @@ async function login(email, password) {
   return parseResponse(response);
 }
 
-async function fetchIncidents() {
-  const response = await fetch(`${API_BASE}/incidents/`, {
+async function fetchIncidentDelta(token) {
+  const query = token ? `?since=${encodeURIComponent(token)}` : "";
+  const response = await fetch(`${API_BASE}/incidents/delta${query}`, {
     headers: authHeaders(),
   });
   return parseResponse(response);
@@ -485,7 +488,7 @@ function renderIncidents() {
       try {
         await updateIncidentStatus(id, event.target.value);
         showToast("Status updated.");
-        await refreshAll();
+        await syncIncidents();
       } catch (error) {
         showToast(error.message, "error");
       }
@@ -591,24 +594,88 @@ function connectRealtime() {
     state.ws.close();
   }
   const wsBase = `${window.location.protocol === "https:" ? "wss" : "ws"}://${window.location.hostname}:8000/ws/incidents`;
-  state.ws = new WebSocket(wsBase);
-  state.ws.onmessage = async () => {
-    await refreshAll();
-    showToast("Incident stream updated.");
+  // Resume from the last seen sequence number so only missed events are sent.
+  const query = state.wsSeq !== null ? `?since=${state.wsSeq}` : "";
+  state.ws = new WebSocket(`${wsBase}${query}`);
+  state.ws.onmessage = async (event) => {
+    let message;
+    try {
+      message = JSON.parse(event.data);
+    } catch (error) {
+      return;
+    }
+    if (typeof message.seq === "number") {
+      state.wsSeq = Math.max(state.wsSeq ?? 0, message.seq);
+    }
+    if (message.type === "incident") {
+      mergeIncidents([message.data]);
+      showToast("Incident stream updated.");
+    } else if (message.type === "resync") {
+      // Missed events are gone from the server's buffer; catch up through
+      // the delta feed, which also reports deletions.
+      await syncIncidents();
+    } else if (message.type === "incidents_bulk") {
+      if (message.action === "delete") {
+        removeIncidents(message.ids || []);
+      } else {
+        await syncIncidents();
+      }
+    }
   };
   state.ws.onclose = () => {
     setTimeout(connectRealtime, 2500);
   };
 }
 
+function mergeIncidents(incidents) {
+  if (!incidents.length) {
+    return;
+  }
+  const byId = new Map(state.incidents.map((incident) => [incident.id, incident]));
+  incidents.forEach((incident) => byId.set(incident.id, incident));
+  state.incidents = [...byId.values()].sort((a, b) =>
+    String(b.created_at).localeCompare(String(a.created_at)),
+  );
+  renderOverview();
+  renderIncidents();
+}
+
+function removeIncidents(ids) {
+  if (!ids.length) {
+    return;
+  }
+  const removed = new Set(ids);
+  state.incidents = state.incidents.filter((incident) => !removed.has(incident.id));
+  renderOverview();
+  renderIncidents();
+}
+
+// Pulls only incidents created, changed or deleted since the last sync token.
+async function syncIncidents() {
+  const changed = [];
+  const deleted = [];
+  let page;
+  do {
+    page = await fetchIncidentDelta(state.syncToken);
+    changed.push(...page.incidents);
+    deleted.push(...(page.deleted || []));
+    if (page.next_token) {
+      state.syncToken = page.next_token;
+    }
+  } while (page.has_more);
+  mergeIncidents(changed);
+  removeIncidents(deleted);
+}
+
 async function refreshAll() {
   try {
-    const [incidents, sensitivity, cameras] = await Promise.all([
-      fetchIncidents(),
+    state.incidents = [];
+    state.syncToken = null;
+    const [, sensitivity, cameras] = await Promise.all([
+      syncIncidents(),
       getSensitivity(),
       getCameras(),
     ]);
-    state.incidents = incidents;
     state.sensitivity = sensitivity.sensitivity ?? 50;
     state.cameras = cameras;
     renderOverview();
@@ -632,6 +699,8 @@ function logout() {
     state.ws.close();
     state.ws = null;
   }
+  state.wsSeq = null;
+  state.syncToken = null;
   showLogin();
 }
 